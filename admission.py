@@ -0,0 +1,173 @@
+import os
+import math
+import time
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+from flask import g, request, jsonify
+
+# Trust X-Forwarded-For for client identity (only behind a proxy that sets it, e.g. Vercel or nginx)
+TRUST_PROXY = os.environ.get('TRUST_PROXY', '').lower() in ('1', 'true', 'yes')
+
+
+def client_id():
+    """Identify the client a request counts against"""
+    if TRUST_PROXY and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr or 'unknown'
+
+
+class TokenBucket:
+    """Per-client rate limit shared by all workers through the state backend"""
+
+    def __init__(self, backend, name, rate, burst):
+        self.backend = backend
+        self.name = name
+        self.rate = rate    # tokens added per second
+        self.burst = burst  # bucket size
+
+    def take(self, client):
+        """Return (allowed, retry_after_seconds)"""
+        now = time.time()
+
+        def change(bucket):
+            tokens = bucket.get('tokens', self.burst)
+            tokens = min(self.burst, tokens + (now - bucket.get('updated', now)) * self.rate)
+            bucket['granted'] = tokens >= 1
+            bucket['tokens'] = tokens - 1 if bucket['granted'] else tokens
+            bucket['updated'] = now
+
+        # An idle bucket is full again after burst / rate seconds, so it can expire then
+        bucket = self.backend.modify(f"bucket:{self.name}", client, change, ttl=self.burst / self.rate + 1)
+        if bucket['granted']:
+            return True, 0
+        return False, math.ceil((1 - bucket['tokens']) / self.rate)
+
+
+class ConcurrencyLimit:
+    """Cap on in-flight work in this worker, with a bounded wait for a free slot"""
+
+    def __init__(self, max_inflight, queue_timeout, max_waiting):
+        self.max_inflight = max_inflight
+        self.queue_timeout = queue_timeout
+        self.max_waiting = max_waiting
+        self._slots = threading.BoundedSemaphore(max_inflight)
+        self._lock = threading.Lock()
+        self.inflight = 0
+        self.waiting = 0
+
+    def acquire(self):
+        with self._lock:
+            if self.inflight >= self.max_inflight and self.waiting >= self.max_waiting:
+                # The queue is already full, don't even wait
+                return False
+            self.waiting += 1
+        try:
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        if acquired:
+            with self._lock:
+                self.inflight += 1
+        return acquired
+
+    def release(self):
+        with self._lock:
+            self.inflight -= 1
+        self._slots.release()
+
+
+class AdmissionController:
+    """Rate limits and concurrency caps per endpoint class ('extract', 'download', ...)
+
+    Decorate expensive views with limit(); cheap endpoints are simply left undecorated.
+    Overload is answered right away with 429 (client over its rate) or 503 (server
+    busy), both with Retry-After.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.buckets = {}
+        self.limits = {}
+
+    def add_class(self, name, rate, burst, max_inflight, queue_timeout, max_waiting):
+        self.buckets[name] = TokenBucket(self.backend, name, rate, burst)
+        self.limits[name] = ConcurrencyLimit(max_inflight, queue_timeout, max_waiting)
+
+    def _reject(self, status, error_type, message, retry_after):
+        self.backend.incr('stats', 'admission', f"{g.admission_class}_{error_type}")
+        response = jsonify({
+            'success': False,
+            'status': 'error',
+            'error': message,
+            'error_type': error_type,
+            'message': message
+        })
+        response.headers['Retry-After'] = str(max(1, int(retry_after)))
+        return response, status
+
+    def limit(self, name):
+        """Decorator admitting a view under the given endpoint class"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # Lets views count time spent waiting for a slot as queueing
+                g.admission_started = time.monotonic()
+                rejected = self.rate_limit(name)
+                if rejected is not None:
+                    return rejected
+
+                limit = self.limits[name]
+                if not limit.acquire():
+                    return self._reject(503, 'overloaded', 'Server is busy, please retry shortly',
+                                        max(1, limit.queue_timeout))
+
+                g.admission_release = limit.release
+                try:
+                    return view(*args, **kwargs)
+                finally:
+                    release = g.pop('admission_release', None)
+                    if release is not None:
+                        release()
+            return wrapper
+        return decorator
+
+    def rate_limit(self, name):
+        """Take a token from the current client's bucket, return a 429 response or None"""
+        g.admission_class = name
+        allowed, retry_after = self.buckets[name].take(client_id())
+        if not allowed:
+            return self._reject(429, 'rate_limited', 'Too many requests, slow down', retry_after)
+        return None
+
+    @contextmanager
+    def slot(self, name):
+        """Hold an in-flight slot of the class around a block of work; yields False if none freed up
+
+        For views where only part of the work is expensive (limit() holds the slot for the
+        whole request). Doesn't need a request context, so a caller can answer 503 itself.
+        """
+        limit = self.limits[name]
+        if not limit.acquire():
+            self.backend.incr('stats', 'admission', f"{name}_overloaded")
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            limit.release()
+
+    def detach(self):
+        """Hand the current request's slot to background work, return its release callable
+
+        The caller must call it exactly once when the work is done.
+        """
+        return g.pop('admission_release', None) or (lambda: None)
+
+    def status(self):
+        return {
+            name: {'inflight': limit.inflight, 'waiting': limit.waiting, 'max_inflight': limit.max_inflight}
+            for name, limit in self.limits.items()
+        }
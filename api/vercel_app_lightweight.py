@@ -6,16 +6,22 @@ import re
 import json
 from urllib.parse import urlparse, parse_qs
 
+import static_assets
+
 # Set up paths for templates and static files
 root_dir = os.path.dirname(os.path.abspath(__file__))
 template_dir = os.path.join(root_dir, 'templates')
-static_dir = os.path.join(root_dir, 'static')
+# The project's static/ folder, where the asset build writes static/dist
+static_dir = os.path.join(os.path.dirname(root_dir), 'static')
 
 app = Flask(__name__, 
           template_folder=template_dir,
           static_folder=static_dir)
 CORS(app)
 
+# Serve fingerprinted, precompressed assets once `python static_assets.py` has been run
+static_assets.init_app(app)
+
 # For Vercel deployment
 IS_VERCEL = True
 DOWNLOADS_ENABLED = False
@@ -141,7 +147,7 @@ def debug_info():
     """Debug endpoint to help diagnose deployment issues"""
     root_path = os.path.dirname(os.path.abspath(__file__))
     template_path = os.path.join(root_path, 'templates')
-    static_path = os.path.join(root_path, 'static')
+    static_path = app.static_folder
     
     template_exists = os.path.exists(template_path)
     index_exists = os.path.exists(os.path.join(template_path, 'index.html'))
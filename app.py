@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_from_directory, render_template
+from flask import Flask, request, jsonify, send_from_directory, render_template, redirect, g
 from flask_cors import CORS
 import yt_dlp
 import os
@@ -7,18 +7,80 @@ import uuid
 import time
 import re
 import json
+import static_assets
+from shared_state import create_state_backend, SharedDict, worker_id
+from format_selection import audio_format_selector, cost_format_selector, describe_result, AUDIO_TARGETS, QUALITY_TARGETS
+from video_metadata import extract_projected, EXTRACTION_MODES
+from failure_guard import NegativeCache, CircuitBreaker, VIDEO_ERRORS, counts_against_extractor, extractor_key
+from coalescing import RequestCoalescer, canonical_video_key
+from admission import AdmissionController
+from job_timing import JobTimer, JOB_HISTORY_SIZE, list_jobs, prune_jobs, stage_summary
+from prefetch import Prefetcher
+from object_storage import create_storage
+from job_control import (
+    JobInterrupted, ABANDON_AFTER, FINAL_STATUSES, check_interrupt, remove_partial_files, transfer_complete
+)
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# Serve fingerprinted, precompressed assets once `python static_assets.py` has been run
+static_assets.init_app(app)
+
 # Check if we're running on Vercel
 IS_VERCEL = os.environ.get('VERCEL_ENV', False)
 
-# Dictionary to track download progress
-download_progress = {}
+# Progress and metadata live in a shared backend (SQLite by default, see STATE_BACKEND)
+# so every gunicorn worker sees the same jobs and the same warm cache
+state_backend = create_state_backend()
+
+# How long finished jobs and cached video info are kept around (seconds)
+PROGRESS_TTL = int(os.environ.get('PROGRESS_TTL', 24 * 60 * 60))
+VIDEO_INFO_TTL = int(os.environ.get('VIDEO_INFO_TTL', 10 * 60))
+
+# Track download progress, keyed by download_id
+download_progress = SharedDict(state_backend, 'progress', ttl=PROGRESS_TTL)
+
+# Cache extracted video info, keyed by canonical video ID (see canonical_video_key)
+video_info_cache = SharedDict(state_backend, 'video_info', ttl=VIDEO_INFO_TTL)
+
+# 'lean' projects yt-dlp results down to the API fields as soon as they're produced,
+# 'full' lets yt-dlp process them completely first (see video_metadata.py)
+EXTRACTION_MODE = os.environ.get('EXTRACTION_MODE', 'lean')
+if EXTRACTION_MODE not in EXTRACTION_MODES:
+    raise ValueError(f"Unknown EXTRACTION_MODE: {EXTRACTION_MODE}")
+
+# Audio codec used when an audio-only download doesn't ask for one.
+# m4a can be remuxed from YouTube's AAC streams without transcoding; mp3 always needs a transcode
+DEFAULT_AUDIO_CODEC = os.environ.get('DEFAULT_AUDIO_CODEC', 'm4a')
 
-# Dictionary to track requests
-video_info_cache = {}
+# Remember URLs that fail for known reasons, and stop hammering extractors that are broken
+negative_cache = NegativeCache(state_backend)
+circuit_breaker = CircuitBreaker(state_backend)
+
+# Concurrent /api/video-info requests for the same video share a single extraction
+COALESCE_TIMEOUT = int(os.environ.get('COALESCE_TIMEOUT', 30))
+info_coalescer = RequestCoalescer(state_backend, timeout=COALESCE_TIMEOUT, stats_key='video_info')
+
+# Admission control for the expensive endpoints: a per-client token bucket (shared by all
+# workers), plus a cap on in-flight work per worker with a short, bounded wait for a slot
+admission = AdmissionController(state_backend)
+admission.add_class(
+    'extract',
+    rate=float(os.environ.get('EXTRACT_RATE', 1)),
+    burst=int(os.environ.get('EXTRACT_BURST', 10)),
+    max_inflight=int(os.environ.get('EXTRACT_MAX_INFLIGHT', 8)),
+    queue_timeout=float(os.environ.get('EXTRACT_QUEUE_TIMEOUT', 5)),
+    max_waiting=int(os.environ.get('EXTRACT_MAX_WAITING', 16))
+)
+admission.add_class(
+    'download',
+    rate=float(os.environ.get('DOWNLOAD_RATE', 0.2)),
+    burst=int(os.environ.get('DOWNLOAD_BURST', 5)),
+    max_inflight=int(os.environ.get('DOWNLOAD_MAX_INFLIGHT', 4)),
+    queue_timeout=float(os.environ.get('DOWNLOAD_QUEUE_TIMEOUT', 2)),
+    max_waiting=int(os.environ.get('DOWNLOAD_MAX_WAITING', 8))
+)
 
 # For Vercel deployment, we need to use /tmp for temporary storage
 if IS_VERCEL:
@@ -32,14 +94,84 @@ else:
 if not os.path.exists(downloads_folder):
     os.makedirs(downloads_folder)
 
+# Where yt-dlp writes downloads (prefetches must write the very same files)
+output_template = os.path.join(downloads_folder, '%(title)s.%(ext)s')
+
+# Where finished files are kept: the downloads folder, or an S3-compatible bucket (STORAGE_BACKEND)
+storage = create_storage()
+
+def record_prefetch_extraction(url, key, error):
+    """Count a prefetch's extraction like any other (error is None if it succeeded)"""
+    if error is None:
+        circuit_breaker.record_success(extractor_key(url))
+    else:
+        record_extraction_failure(key, extractor_key(url), error)
+
+# Optionally start downloading the likely format as soon as video info is returned (PREFETCH=1).
+# Its extraction goes through the same negative cache and circuit breaker as /api/video-info
+prefetcher = Prefetcher(
+    state_backend, output_template, claim_ttl=PROGRESS_TTL,
+    guard=lambda url, key: check_failure_guard(url, key)[1],
+    record=record_prefetch_extraction
+)
+
 def sanitize_filename(filename):
     """Sanitize the filename to remove invalid characters"""
     return re.sub(r'[\\/*?:"<>|]', "", filename)
 
-def download_progress_hook(d):
-    """Track download progress"""
-    # Get the download_id directly from the dict
-    download_id = d.get('download_id')
+def check_failure_guard(url, key=None):
+    """Return (extractor, error) where error is set if the URL should fail fast"""
+    failure = negative_cache.get(key or canonical_video_key(url))
+    if failure is not None:
+        return None, {
+            'status': 'error',
+            'error': failure['error'],
+            'error_type': failure['error_type'],
+            'retry_after': max(1, int(failure['expires'] - time.time())),
+            'cached': True
+        }
+
+    extractor = extractor_key(url)
+    allowed, retry_after = circuit_breaker.allow(extractor)
+    if not allowed:
+        return extractor, {
+            'status': 'error',
+            'error': f'{extractor} extraction is failing right now, please retry in {retry_after} seconds',
+            'error_type': 'circuit_open',
+            'retry_after': retry_after
+        }
+    return extractor, None
+
+def record_extraction_failure(key, extractor, error):
+    """Cache classified failures and count the extractor's own ones against its breaker"""
+    error_type = negative_cache.put(key, str(error))
+    if error_type in VIDEO_ERRORS:
+        # The extractor worked, the video itself is the problem
+        circuit_breaker.record_success(extractor)
+    elif error_type == 'rate_limited' or counts_against_extractor(error):
+        circuit_breaker.record_failure(extractor)
+    return error_type
+
+def guard_response(result):
+    """Build the fail-fast response for an error from check_failure_guard (or an overloaded extract)"""
+    response = jsonify({
+        'success': False,
+        'status': 'error',
+        'error': result['error'],
+        'error_type': result['error_type'],
+        'message': result['error']
+    })
+    response.headers['Retry-After'] = str(result['retry_after'])
+    if result['error_type'] in ('circuit_open', 'overloaded'):
+        return response, 503
+    if result['error_type'] == 'rate_limited':
+        return response, 429
+    return response, 422
+
+def download_progress_hook(d, download_id=None):
+    """Track download progress, return the updated progress entry"""
+    # yt-dlp doesn't pass our options to the hook, so the download_id is bound by download_video
+    download_id = download_id or d.get('download_id')
     
     if download_id is None or download_id not in download_progress:
         return
@@ -54,7 +186,7 @@ def download_progress_hook(d):
             else:
                 percent = 0
                 
-            download_progress[download_id].update({
+            return download_progress.merge(download_id, {
                 'status': 'downloading',
                 'percent': round(percent, 2),
                 'speed': d.get('speed', 0),
@@ -62,74 +194,195 @@ def download_progress_hook(d):
                 'filename': d.get('filename', '')
             })
         except Exception as e:
-            download_progress[download_id].update({
+            return download_progress.merge(download_id, {
                 'status': 'error',
                 'error': str(e)
             })
             
     elif d['status'] == 'finished':
-        download_progress[download_id].update({
+        return download_progress.merge(download_id, {
             'status': 'processing',
             'percent': 100,
             'filename': d.get('filename', '')
         })
         
     elif d['status'] == 'error':
-        download_progress[download_id].update({
+        return download_progress.merge(download_id, {
             'status': 'error',
             'error': str(d.get('error', 'Unknown error'))
         })
 
-def download_video(url, download_id, options):
+def remove_job_files(key, download_id, partial_files):
+    """Delete a cancelled job's files, unless another job of the same video still writes them"""
+    if prefetcher.claimed(key, exclude=download_id):
+        print(f"Keeping the files of cancelled download {download_id}, another download of {key} uses them")
+        return []
+    return remove_partial_files(partial_files)
+
+def finish_interrupted(download_id, interrupted, key, partial_files):
+    """Settle a paused or cancelled job once its download has stopped"""
+    outcome = {}
+
+    def change(entry):
+        # A cancel that arrived while the job was stopping for a pause still wins
+        outcome['action'] = 'cancel' if entry.get('control') == 'cancel' else interrupted.action
+        entry['control'] = None
+        if outcome['action'] == 'pause':
+            entry['status'] = 'paused'
+        else:
+            entry['status'] = 'cancelled'
+            entry['cancel_reason'] = interrupted.reason
+
+    state_backend.modify('progress', download_id, change, ttl=PROGRESS_TTL)
+    if outcome['action'] == 'cancel':
+        download_progress.merge(download_id, {'removed_files': remove_job_files(key, download_id, partial_files)})
+    return outcome['action']
+
+def download_video(url, download_id, options, extractor=None, timer=None):
+    extractor = extractor or extractor_key(url)
+    timer = timer or JobTimer(download_progress, download_id)
+    video_key = canonical_video_key(url)
+    # The files this job created (or took over from its paused run or an adopted prefetch),
+    # the only ones a cancel deletes. Files already in the downloads folder belong to others
+    partial_files = set(download_progress.get(download_id, {}).get('partial_files') or [])
+    existing = set()
+    seen = set()
+
+    def progress_hook(d):
+        new_files = {d.get('tmpfilename'), d.get('filename')} - seen - {None}
+        if new_files:
+            seen.update(new_files)
+            owned = {name for name in new_files if os.path.basename(name) not in existing} - partial_files
+            if owned:
+                partial_files.update(owned)
+                download_progress.merge(download_id, {'partial_files': sorted(partial_files)})
+        entry = download_progress_hook(d, download_id)
+        # Pause/cancel requests (from any worker) stop the transfer on its next progress update
+        if not transfer_complete(d):
+            check_interrupt(entry)
+
+    def postprocessor_hook(d):
+        timer.postprocessor_hook(d)
+        if d.get('status') == 'started':
+            # Don't start merging or transcoding for a job that's being stopped
+            check_interrupt(download_progress.get(download_id))
+
     try:
-        format_option = options.get('format', 'bestvideo[height<=720]+bestaudio/best[height<=720]')
+        format_option = options.get('format', '720p')
+        audio_only = options.get('mode') == 'audio'
         
         # Set download options
         ydl_opts = {
             'format': format_option,
-            'outtmpl': os.path.join(downloads_folder, '%(title)s.%(ext)s'),
-            'progress_hooks': [download_progress_hook],
+            'outtmpl': output_template,
+            'progress_hooks': [timer.download_hook, progress_hook],
+            'postprocessor_hooks': [postprocessor_hook],
             'noplaylist': True,
             'merge_output_format': 'mp4',  # Merge video and audio into mp4
             # Add download_id directly to each progress hook call
             'download_id': download_id,
-            'quiet': False,
+            # The batch CLI runs many jobs at once and keeps yt-dlp's progress bars off the console
+            'quiet': options.get('quiet', False),
+            'noprogress': options.get('quiet', False),
             'no_warnings': False,
-            'ignoreerrors': True
+            # Let errors raise so they can be reported and classified
+            'ignoreerrors': False
         }
         
+        if audio_only:
+            # Fetch a single audio-only stream, never any video bytes.
+            # ExtractAudio only remuxes (or skips) when the chosen stream already has the target codec
+            audio_codec = options.get('audio_codec', DEFAULT_AUDIO_CODEC)
+            audio_bitrate = options.get('audio_bitrate')
+            ydl_opts['format'] = audio_format_selector(audio_codec, audio_bitrate)
+            del ydl_opts['merge_output_format']
+            ydl_opts['postprocessors'] = [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': audio_codec,
+                'preferredquality': str(audio_bitrate) if audio_bitrate else None
+            }]
+            format_option = f"audio ({audio_codec}{f', {audio_bitrate}k' if audio_bitrate else ''})"
+        elif format_option in QUALITY_TARGETS:
+            # Pick the cheapest stream(s) for the quality target and report it before downloading.
+            # Anything else is passed to yt-dlp as a raw format spec
+            ydl_opts['format'] = cost_format_selector(
+                format_option,
+                on_choice=lambda choice: download_progress.merge(download_id, {'chosen_format': choice})
+            )
+        
         # Log the requested format for debugging
         print(f"Download initiated with format: {format_option}")
         
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # First get video info
+            # First get video info (extraction only, formats are picked when processing)
+            timer.enter('extracting')
             try:
-                info_dict = ydl.extract_info(url, download=False)
-                if info_dict is None:
-                    raise Exception("Failed to retrieve video information")
+                try:
+                    info_dict = ydl.extract_info(url, download=False, process=False)
+                    if info_dict is None:
+                        raise Exception("Failed to retrieve video information")
+                except Exception as extract_e:
+                    record_extraction_failure(canonical_video_key(url), extractor, extract_e)
+                    raise
+                circuit_breaker.record_success(extractor)
                 
-                # Get thumbnail URL from info dict
-                thumbnail_url = None
-                if 'thumbnail' in info_dict:
-                    thumbnail_url = info_dict['thumbnail']
-                elif 'thumbnails' in info_dict and len(info_dict['thumbnails']) > 0:
-                    thumbnail_url = info_dict['thumbnails'][-1]['url']  # Get the last (usually highest quality) thumbnail
+                # The job may have been paused or cancelled while extracting
+                check_interrupt(download_progress.get(download_id))
                 
-                # Now download the video
-                ydl.download([url])
+                # Take over a speculative prefetch of this video so only one writer touches its files.
+                # The claim comes first, so no new prefetch can start until this job is done
+                prefetcher.claim(video_key, download_id)
+                existing.update(os.listdir(downloads_folder))
+                adopted = prefetcher.adopt(
+                    video_key,
+                    None if audio_only or format_option not in QUALITY_TARGETS else format_option
+                )
+                if adopted:
+                    partial_files.update(adopted['files'])
+                    download_progress.merge(download_id, {
+                        'prefetched_bytes': adopted['bytes'],
+                        'partial_files': sorted(partial_files)
+                    })
+                
+                # Now download the video, reusing the extracted info instead of extracting again.
+                # A resumed job continues from the .part files its paused run left behind
+                result = ydl.process_ie_result(info_dict, download=True)
+                if result and not download_progress.get(download_id, {}).get('chosen_format'):
+                    # Only the cost-based selector reports its choice up front
+                    download_progress.merge(download_id, {'chosen_format': describe_result(result, format_option)})
+                
+                # Processing sorts the thumbnails and sets 'thumbnail' to the best one
+                # (the raw extractor result's list is in no particular order)
+                thumbnail_url = (result or {}).get('thumbnail') or info_dict.get('thumbnail')
                 
                 # Get actual quality that was downloaded
                 requested_height = None
-                if "720" in format_option:
-                    requested_height = "720p"
-                elif "1080" in format_option:
-                    requested_height = "1080p"
+                if audio_only:
+                    requested_height = format_option
+                elif result and result.get('height'):
+                    requested_height = f"{result['height']}p"
                 else:
                     requested_height = "Best Available"
                 
                 # Update progress when complete
-                filename = sanitize_filename(info_dict.get('title', 'video') + '.mp4')
-                download_progress[download_id].update({
+                downloads = (result or {}).get('requested_downloads') or []
+                if downloads and downloads[0].get('filepath'):
+                    filename = os.path.basename(downloads[0]['filepath'])
+                else:
+                    filename = sanitize_filename(info_dict.get('title', 'video') + '.mp4')
+                filepath = os.path.join(downloads_folder, filename)
+                
+                def upload_file():
+                    download_progress.merge(download_id, {'status': 'uploading'})
+                    try:
+                        storage.upload(filepath, filename)
+                    except Exception as upload_e:
+                        # The local copy still works, Flask just has to serve it
+                        print(f"Upload of {filename} failed, serving it locally: {str(upload_e)}")
+                        download_progress.merge(download_id, {'upload_error': str(upload_e)})
+                
+                timer.finish(filepath, upload_file if storage.remote and os.path.exists(filepath) else None)
+                download_progress.merge(download_id, {
                     'status': 'complete',
                     'filename': filename,
                     'title': info_dict.get('title', 'Unknown'),
@@ -141,15 +394,63 @@ def download_video(url, download_id, options):
                 print(f"Error during video info extraction: {str(inner_e)}")
                 raise inner_e
         
+    except JobInterrupted as e:
+        print(f"Download {download_id} stopped: {e.reason}")
+        timer.interrupt(finish_interrupted(download_id, e, video_key, partial_files))
     except Exception as e:
         print(f"Download error: {str(e)}")
-        download_progress[download_id].update({
+        timer.fail()
+        download_progress.merge(download_id, {
             'status': 'error',
             'error': str(e)
         })
+    finally:
+        # A paused job keeps its claim, its partial files are still in use
+        if download_progress.get(download_id, {}).get('status') != 'paused':
+            prefetcher.release(video_key, download_id)
+        # Keep the job history bounded
+        prune_jobs(download_progress)
 
-def get_video_info(url, request_id):
+def cached_video_info(key):
+    """Video info any worker extracted recently, or None"""
+    cached = video_info_cache.get(key)
+    if cached is not None:
+        state_backend.incr('stats', 'video_info', 'cache_hits')
+    return cached
+
+def get_video_info(url):
     """Extract video information without downloading"""
+    key = canonical_video_key(url)
+    
+    # Any worker may have extracted this video recently
+    cached = cached_video_info(key)
+    if cached is not None:
+        return cached
+
+    # Fail fast for URLs that just failed, or while the extractor is known to be broken
+    extractor, failure = check_failure_guard(url, key)
+    if failure is not None:
+        return failure
+
+    def extract():
+        # Only the leader holds an extract slot; followers just wait for its result
+        with admission.slot('extract') as admitted:
+            if not admitted:
+                return {
+                    'status': 'error',
+                    'error': 'Server is busy, please retry shortly',
+                    'error_type': 'overloaded',
+                    'retry_after': max(1, int(admission.limits['extract'].queue_timeout))
+                }
+            return extract_video_info(url, key, extractor)
+
+    # The first request for a video extracts it, concurrent ones wait for that result
+    # (checking the cache again, the previous leader may have filled it just now)
+    result, _role = info_coalescer.run(key, extract, lookup=lambda: cached_video_info(key))
+    return result
+
+def extract_video_info(url, key, extractor):
+    """Run yt-dlp for get_video_info and cache the result"""
     try:
         # Set download options for testing
         ydl_opts = {
@@ -159,53 +460,25 @@ def get_video_info(url, request_id):
         }
         
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # Extract info without downloading
-            info_dict = ydl.extract_info(url, download=False)
+            # Extract info without downloading, projected down to the fields the API returns
+            result = extract_projected(ydl, url, EXTRACTION_MODE)
             
-            if info_dict is None:
-                video_info_cache[request_id] = {
+            if result is None:
+                record_extraction_failure(key, extractor, Exception('Failed to retrieve video information'))
+                return {
                     'status': 'error',
                     'error': 'Failed to retrieve video information'
                 }
-                return
-            
-            # Get thumbnail URLs
-            thumbnails = []
-            if 'thumbnail' in info_dict:
-                thumbnails.append({'url': info_dict['thumbnail'], 'type': 'default'})
-            
-            if 'thumbnails' in info_dict:
-                for i, thumb in enumerate(info_dict['thumbnails']):
-                    if 'url' in thumb:
-                        thumbnails.append({'url': thumb['url'], 'type': f'thumbnail_{i}'})
-            
-            # Get available formats
-            formats = []
-            for fmt in info_dict.get('formats', []):
-                if fmt.get('format_id'):
-                    formats.append({
-                        'format_id': fmt.get('format_id'),
-                        'format': fmt.get('format'),
-                        'width': fmt.get('width'),
-                        'height': fmt.get('height'),
-                        'ext': fmt.get('ext')
-                    })
+            circuit_breaker.record_success(extractor)
             
-            # Prepare response
-            video_info_cache[request_id] = {
-                'status': 'success',
-                'title': info_dict.get('title', 'Unknown'),
-                'duration': info_dict.get('duration'),
-                'thumbnails': thumbnails,
-                'formats': formats,
-                'url': url,
-                'timestamp': time.time()
-            }
+            video_info_cache[key] = result
+            return result
             
     except Exception as e:
-        video_info_cache[request_id] = {
+        return {
             'status': 'error',
-            'error': str(e)
+            'error': str(e),
+            'error_type': record_extraction_failure(key, extractor, e)
         }
 
 @app.route('/')
@@ -224,26 +497,30 @@ def get_info():
     if not url.startswith(('http://', 'https://')):
         return jsonify({'status': 'error', 'error': 'Invalid URL format'}), 400
     
-    # Generate a unique ID for this request
-    request_id = str(uuid.uuid4())
-    
     try:
-        # Get video info (in the same thread for simplicity on Vercel)
-        get_video_info(url, request_id)
+        # Cached info is cheap: it takes no rate limit token, and only extraction takes a slot
+        key = canonical_video_key(url)
+        result = cached_video_info(key)
+        if result is None:
+            rejected = admission.rate_limit('extract')
+            if rejected is not None:
+                return rejected
+            # Get video info (in the same thread for simplicity on Vercel)
+            result = get_video_info(url)
+        
+        if result.get('error_type') in ('circuit_open', 'overloaded'):
+            return guard_response(result)
+        
+        if result['status'] == 'success' and DOWNLOADS_ENABLED:
+            # Use the idle time until the user clicks download
+            prefetcher.start(url, key, request.json.get('format'))
         
         # Return the result
-        if request_id in video_info_cache:
-            result = video_info_cache[request_id]
-            return jsonify({
-                'success': result['status'] == 'success',
-                'info': result,
-                'downloadable': DOWNLOADS_ENABLED
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'message': 'Failed to retrieve video information'
-            })
+        return jsonify({
+            'success': result['status'] == 'success',
+            'info': result,
+            'downloadable': DOWNLOADS_ENABLED
+        })
     except Exception as e:
         return jsonify({
             'success': False,
@@ -253,9 +530,21 @@ def get_info():
 # If downloads are enabled (local environment), include these routes
 if DOWNLOADS_ENABLED:
     @app.route('/api/download', methods=['POST'])
+    @admission.limit('download')
     def start_download():
         url = request.json.get('url')
         format_option = request.json.get('format', 'best')
+        options = {'format': format_option}
+        
+        # Audio-only jobs skip the video stream entirely
+        if format_option == 'audio' or request.json.get('mode') == 'audio':
+            audio_codec = request.json.get('audio_codec', DEFAULT_AUDIO_CODEC)
+            if audio_codec not in AUDIO_TARGETS:
+                return jsonify({'status': 'error', 'error': f'Unsupported audio codec: {audio_codec}'}), 400
+            audio_bitrate = request.json.get('audio_bitrate')
+            if audio_bitrate is not None and (not isinstance(audio_bitrate, int) or audio_bitrate <= 0):
+                return jsonify({'status': 'error', 'error': 'audio_bitrate must be a positive number of kbps'}), 400
+            options.update({'mode': 'audio', 'audio_codec': audio_codec, 'audio_bitrate': audio_bitrate})
         
         if not url:
             return jsonify({'status': 'error', 'error': 'URL is required'}), 400
@@ -264,6 +553,15 @@ if DOWNLOADS_ENABLED:
         if not url.startswith(('http://', 'https://')):
             return jsonify({'status': 'error', 'error': 'Invalid URL format'}), 400
         
+        # Don't spend a worker on URLs that just failed or extractors that are down
+        extractor, failure = check_failure_guard(url)
+        if failure is not None:
+            return guard_response(failure)
+        
+        if options.get('mode') != 'audio':
+            # Past choices decide what gets prefetched for clients that don't say
+            prefetcher.record_choice(format_option)
+        
         # Generate a unique ID for this download
         download_id = str(uuid.uuid4())
         
@@ -271,21 +569,113 @@ if DOWNLOADS_ENABLED:
         download_progress[download_id] = {
             'status': 'starting',
             'percent': 0,
-            'url': url
+            'url': url,
+            'options': options,
+            'extractor': extractor,
+            # Which worker runs the job; any worker can answer progress polls
+            'owner': worker_id(),
+            'created': time.time()
         }
-        
-        # Start download in a separate thread
-        download_thread = threading.Thread(
-            target=download_video,
-            args=(url, download_id, {'format': format_option})
-        )
-        download_thread.daemon = True
-        download_thread.start()
+        # The job counts as queued from when the request arrived, including any admission wait
+        timer = JobTimer(download_progress, download_id, started=g.get('admission_started'))
+        start_download_thread(url, download_id, options, extractor, timer)
         
         return jsonify({
             'status': 'started',
             'download_id': download_id
         })
+    
+    def start_download_thread(url, download_id, options, extractor, timer):
+        """Run download_video in a daemon thread that owns the request's admission slot"""
+        # The download keeps its admission slot until the thread is done (or paused/cancelled)
+        release_slot = admission.detach()
+        
+        def run_download():
+            try:
+                download_video(url, download_id, options, extractor, timer)
+            finally:
+                release_slot()
+        
+        # Start download in a separate thread
+        download_thread = threading.Thread(target=run_download)
+        download_thread.daemon = True
+        download_thread.start()
+    
+    def control_job(download_id, change):
+        """Apply change() to a job's progress entry atomically, return (status before, entry)"""
+        before = {}
+        
+        def tracked(entry):
+            before['status'] = entry.get('status')
+            change(entry)
+        
+        entry = state_backend.modify('progress', download_id, tracked, ttl=PROGRESS_TTL)
+        return before['status'], entry
+    
+    @app.route('/api/download/<download_id>', methods=['DELETE'])
+    def cancel_download(download_id):
+        """Cancel a job and delete its partial files"""
+        if download_id not in download_progress:
+            return jsonify({'status': 'not_found'}), 404
+        
+        def change(entry):
+            if entry.get('status') == 'paused':
+                # Nothing is running, so cancel right here
+                entry['status'] = 'cancelled'
+                entry['cancel_reason'] = 'cancel requested'
+            elif entry.get('status') not in FINAL_STATUSES:
+                # The worker running the job stops it on its next progress update
+                entry['control'] = 'cancel'
+        
+        status, entry = control_job(download_id, change)
+        if status in FINAL_STATUSES:
+            return jsonify({'status': 'error', 'error': f'Download is already {status}'}), 409
+        if status == 'paused':
+            key = canonical_video_key(entry['url'])
+            prefetcher.release(key, download_id)
+            removed = remove_job_files(key, download_id, entry.get('partial_files'))
+            download_progress.merge(download_id, {'removed_files': removed})
+            return jsonify({'status': 'cancelled', 'download_id': download_id, 'removed_files': removed})
+        return jsonify({'status': 'cancelling', 'download_id': download_id}), 202
+    
+    @app.route('/api/download/<download_id>/pause', methods=['POST'])
+    def pause_download(download_id):
+        """Stop a running job but keep its partial files for /resume"""
+        if download_id not in download_progress:
+            return jsonify({'status': 'not_found'}), 404
+        
+        def change(entry):
+            if entry.get('status') not in FINAL_STATUSES + ('paused',) and entry.get('control') is None:
+                entry['control'] = 'pause'
+        
+        status, entry = control_job(download_id, change)
+        if entry.get('control') != 'pause':
+            state = 'being cancelled' if entry.get('control') == 'cancel' else status
+            return jsonify({'status': 'error', 'error': f'Download is already {state}'}), 409
+        return jsonify({'status': 'pausing', 'download_id': download_id}), 202
+    
+    @app.route('/api/download/<download_id>/resume', methods=['POST'])
+    @admission.limit('download')
+    def resume_download(download_id):
+        """Restart a paused job; yt-dlp picks up where the partial files left off"""
+        if download_id not in download_progress:
+            return jsonify({'status': 'not_found'}), 404
+        
+        def change(entry):
+            # Only one resume request may restart the job
+            if entry.get('status') == 'paused':
+                entry['status'] = 'starting'
+                entry['owner'] = worker_id()
+                entry['last_polled'] = time.time()
+        
+        status, entry = control_job(download_id, change)
+        if status != 'paused':
+            return jsonify({'status': 'error', 'error': f'Download is {status}, not paused'}), 409
+        
+        timer = JobTimer(download_progress, download_id, started=g.get('admission_started'),
+                         previous=entry.get('timing'))
+        start_download_thread(entry['url'], download_id, entry['options'], entry.get('extractor'), timer)
+        return jsonify({'status': 'resumed', 'download_id': download_id})
 else:
     # In Vercel environment, replace download with a message
     @app.route('/api/download', methods=['POST'])
@@ -300,8 +690,24 @@ def get_progress(download_id):
     if download_id not in download_progress:
         return jsonify({'status': 'not_found'}), 404
     
+    if ABANDON_AFTER:
+        # Jobs nobody polls any more are cancelled (see job_control.check_interrupt)
+        return jsonify(download_progress.merge(download_id, {'last_polled': time.time()}))
     return jsonify(download_progress[download_id])
 
+@app.route('/api/jobs')
+def get_jobs():
+    """Recent download jobs with their per-stage timing, plus mean stage times per extractor"""
+    limit = request.args.get('limit', 50, type=int)
+    jobs = list_jobs(download_progress)
+    extractor = request.args.get('extractor')
+    if extractor:
+        jobs = [job for job in jobs if job.get('extractor') == extractor]
+    return jsonify({
+        'jobs': jobs[:max(0, min(limit, JOB_HISTORY_SIZE))],
+        'summary': stage_summary(jobs)
+    })
+
 @app.route('/downloads/<path:filename>')
 def download_file(filename):
     try:
@@ -309,6 +715,15 @@ def download_file(filename):
         print(f"Download requested for file: {filename}")
         print(f"Download folder path: {downloads_folder}")
         
+        if storage.remote:
+            try:
+                if storage.exists(filename):
+                    # The bucket serves the bytes, this worker only signs the link
+                    return redirect(storage.download_url(filename))
+            except Exception as e:
+                # e.g. missing permissions or the bucket being down: a local copy can still be served
+                print(f"Error checking stored download {filename}: {str(e)}")
+
         # Check if file exists
         file_path = os.path.join(downloads_folder, filename)
         if not os.path.exists(file_path):
@@ -337,8 +752,26 @@ def list_downloads():
                 })
     except Exception as e:
         print(f"Error listing downloads: {str(e)}")
+    if storage.remote:
+        try:
+            local = {f['name'] for f in files}
+            files.extend(f for f in storage.list() if f['name'] not in local)
+        except Exception as e:
+            print(f"Error listing stored downloads: {str(e)}")
     return jsonify(files)
 
+@app.route('/api/stats')
+def get_stats():
+    """Counters for /api/video-info (cache hits, leaders, followers), prefetch and admission control"""
+    return jsonify({
+        'video_info': state_backend.get('stats', 'video_info') or {},
+        'prefetch': state_backend.get('stats', 'prefetch') or {},
+        'admission': {
+            'rejected': state_backend.get('stats', 'admission') or {},
+            'worker': admission.status()
+        }
+    })
+
 @app.route('/api/vercel-info')
 def vercel_info():
     """Return information about the Vercel environment"""
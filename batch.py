@@ -0,0 +1,187 @@
+"""Download a list of URLs without the web tier
+
+    python batch.py urls.txt --jobs 8 --format 720p --manifest results.jsonl
+    cat urls.txt | python batch.py - --audio --audio-codec mp3
+
+Jobs go through the same engine as /api/download (format selection, failure guard,
+job timing, storage backend) and share its state backend, so they also show up in
+/api/jobs. Each finished job appends a line to the JSONL manifest. Running the same
+command again skips URLs the manifest already has as complete, retries deferred ones
+(rate limits, open circuit breakers), and Ctrl-C pauses running downloads so the next
+run continues from their partial files.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import app as engine
+from failure_guard import VIDEO_ERRORS, classify_error
+from format_selection import AUDIO_TARGETS, QUALITY_TARGETS
+from job_timing import JobTimer
+from shared_state import worker_id
+
+
+def read_urls(source):
+    """URLs from a file or stdin ('-'), one per line; blank lines and # comments are skipped"""
+    stream = sys.stdin if source == '-' else open(source)
+    try:
+        return [line.strip() for line in stream if line.strip() and not line.lstrip().startswith('#')]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def read_manifest(path):
+    """Last manifest record per video key (a resumed run appends newer records)"""
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by the interruption
+                continue
+            records[record['key']] = record
+    return records
+
+
+# Download IDs of the jobs running right now, so Ctrl-C can pause them
+active = set()
+
+
+def run_job(url, key, options):
+    """Run one download through the app's engine, return its manifest record"""
+    download_id = str(uuid.uuid4())
+    record = {'url': url, 'key': key, 'download_id': download_id}
+
+    extractor, failure = engine.check_failure_guard(url, key)
+    if failure is not None:
+        # Only failures of the video itself are final; a rate limit or open breaker passes
+        status = 'error' if failure['error_type'] in VIDEO_ERRORS else 'deferred'
+        record.update({'status': status, 'error': failure['error'], 'error_type': failure['error_type']})
+        return record
+
+    engine.download_progress[download_id] = {
+        'status': 'starting',
+        'percent': 0,
+        'url': url,
+        'options': options,
+        'extractor': extractor,
+        'owner': worker_id(),
+        'created': time.time(),
+        # Nobody polls batch jobs, so ABANDON_AFTER must not cancel them
+        'unattended': True
+    }
+    active.add(download_id)
+    try:
+        engine.download_video(url, download_id, options, extractor, JobTimer(engine.download_progress, download_id))
+    finally:
+        active.discard(download_id)
+
+    entry = engine.download_progress.get(download_id, {})
+    timing = entry.get('timing') or {}
+    status = entry.get('status', 'error')
+    error_type = classify_error(entry.get('error')) if status == 'error' else None
+    if error_type == 'rate_limited':
+        status = 'deferred'
+    record.update({
+        'status': status,
+        'error_type': error_type,
+        'title': entry.get('title'),
+        'filename': entry.get('filename'),
+        'requested_quality': entry.get('requested_quality'),
+        'chosen_format': entry.get('chosen_format'),
+        'error': entry.get('error'),
+        'seconds': timing.get('total'),
+        'stages': {stage['stage']: stage['duration'] for stage in timing.get('stages', [])},
+        'finished': time.time()
+    })
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('source', nargs='?', default='-', help="file with one URL per line, or - for stdin")
+    parser.add_argument('--jobs', '-j', type=int, default=4, help='parallel downloads (default: 4)')
+    parser.add_argument('--format', '-f', default='best',
+                        help=f"quality ({', '.join(QUALITY_TARGETS)}) or a raw yt-dlp format spec (default: best)")
+    parser.add_argument('--audio', action='store_true', help='download audio only')
+    parser.add_argument('--audio-codec', default=engine.DEFAULT_AUDIO_CODEC, choices=sorted(AUDIO_TARGETS))
+    parser.add_argument('--audio-bitrate', type=int, help='target audio bitrate in kbps')
+    parser.add_argument('--manifest', '-m', default='batch_manifest.jsonl', help='JSONL results file (default: %(default)s)')
+    parser.add_argument('--retry-errors', action='store_true',
+                        help='also retry URLs the manifest has as failed (deferred ones are always retried)')
+    args = parser.parse_args()
+
+    options = {'format': args.format, 'quiet': True}
+    if args.audio:
+        options.update({'mode': 'audio', 'audio_codec': args.audio_codec, 'audio_bitrate': args.audio_bitrate})
+
+    done = read_manifest(args.manifest)
+    skip_statuses = ('complete',) if args.retry_errors else ('complete', 'error')
+
+    # One job per video, however many URL forms of it the list has
+    jobs = {}
+    seen = set()
+    skipped = 0
+    for url in read_urls(args.source):
+        if not url.startswith(('http://', 'https://')):
+            print(f"Skipping invalid URL: {url}", file=sys.stderr)
+            continue
+        key = engine.canonical_video_key(url)
+        if key in seen:
+            continue
+        seen.add(key)
+        if done.get(key, {}).get('status') in skip_statuses:
+            skipped += 1
+            continue
+        jobs[key] = url
+
+    print(f"{len(jobs)} to download, {skipped} already in {args.manifest}, {args.jobs} at a time")
+    if not jobs:
+        return
+    counts = {}
+    written = set()
+    started = time.time()
+
+    with open(args.manifest, 'a') as manifest, ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        def write(future):
+            record = future.result()
+            written.add(future)
+            # Flushed per job so an interrupted run loses nothing that finished
+            manifest.write(json.dumps(record) + '\n')
+            manifest.flush()
+            counts[record['status']] = counts.get(record['status'], 0) + 1
+            detail = record.get('filename') or record.get('error') or ''
+            print(f"[{len(written)}/{len(jobs)}] {record['status']:<9} {record['url']}  {detail}")
+
+        futures = [executor.submit(run_job, url, key, options) for key, url in jobs.items()]
+        try:
+            for future in as_completed(futures):
+                write(future)
+        except KeyboardInterrupt:
+            print('Interrupted, pausing running downloads (run again to resume)...', file=sys.stderr)
+            executor.shutdown(wait=False, cancel_futures=True)
+            # Running jobs stop on their next progress update and keep their partial files
+            for download_id in list(active):
+                engine.download_progress.merge(download_id, {'control': 'pause'})
+            for future in as_completed([f for f in futures if not f.cancelled() and f not in written]):
+                write(future)
+            raise SystemExit(130)
+
+    elapsed = time.time() - started
+    print(f"Done in {elapsed:.1f}s: " + ', '.join(f"{count} {status}" for status, count in sorted(counts.items())))
+    if counts.get('deferred'):
+        print(f"Run again to retry the {counts['deferred']} deferred", file=sys.stderr)
+    if counts.get('error') or counts.get('deferred'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
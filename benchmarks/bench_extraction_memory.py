@@ -0,0 +1,172 @@
+"""Peak memory per metadata extraction, per EXTRACTION_MODE
+
+Each mode runs in its own process. After a warm-up extraction, it measures:
+- tracemalloc peak: Python allocations at the worst moment of one extraction
+- retained: allocations still alive after the extraction (i.e. the cached result)
+- RSS peak growth: how much the process's max RSS grew over the measured runs
+
+    python benchmarks/bench_extraction_memory.py              # synthetic YouTube-sized result, offline
+    python benchmarks/bench_extraction_memory.py --info-json dump.json
+    python benchmarks/bench_extraction_memory.py --url https://www.youtube.com/watch?v=...
+
+--info-json replays a `yt-dlp -J` dump through the real yt-dlp processing pipeline,
+--url extracts live (needs network).
+"""
+import os
+import sys
+import gc
+import json
+import argparse
+import resource
+import tracemalloc
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp
+from yt_dlp.extractor.common import InfoExtractor
+from video_metadata import EXTRACTION_MODES, extract_projected
+
+RECORDED_URL = 'recorded:benchmark'
+
+
+def synthetic_info():
+    """A raw extractor result shaped (and sized) like a typical YouTube video"""
+    base = 'https://rr1---sn-example.googlevideo.com/videoplayback?expire=1700000000&ei=' + 'x' * 600
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        'Accept-Language': 'en-us,en;q=0.5',
+        'Sec-Fetch-Mode': 'navigate',
+    }
+    formats = []
+    for i, (height, tbr) in enumerate([(144, 100), (240, 250), (360, 400), (480, 750), (720, 1500), (1080, 2900)] * 4):
+        formats.append({
+            'format_id': str(100 + i),
+            'url': f'{base}&itag={100 + i}',
+            'ext': 'mp4',
+            'width': height * 16 // 9,
+            'height': height,
+            'tbr': tbr,
+            'vcodec': 'avc1.4d401f',
+            'acodec': 'none',
+            'protocol': 'https',
+            'http_headers': dict(headers),
+            'downloader_options': {'http_chunk_size': 10485760},
+            'fragments': [{'url': f'{base}&sq={n}', 'duration': 5.0} for n in range(120)],
+        })
+    for i, abr in enumerate([48, 70, 129, 160]):
+        formats.append({
+            'format_id': str(200 + i), 'url': f'{base}&itag={200 + i}', 'ext': 'm4a',
+            'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': abr, 'tbr': abr, 'protocol': 'https',
+            'http_headers': dict(headers),
+        })
+    captions = {
+        f'lang{n}': [{'ext': ext, 'url': f'{base}&lang={n}&fmt={ext}', 'name': f'Language {n}'}
+                     for ext in ('json3', 'srv1', 'srv2', 'srv3', 'ttml', 'vtt', 'srt')]
+        for n in range(150)
+    }
+    return {
+        'id': 'benchmark',
+        'title': 'Memory benchmark video',
+        'description': 'Lorem ipsum dolor sit amet. ' * 200,
+        'duration': 600,
+        'formats': formats,
+        'thumbnails': [{'url': f'https://i.ytimg.com/vi/benchmark/{n}.jpg', 'preference': n} for n in range(40)],
+        'automatic_captions': captions,
+        'subtitles': {},
+        'heatmap': [{'start_time': n * 6.0, 'end_time': n * 6.0 + 6, 'value': 0.5} for n in range(100)],
+        'tags': ['tag'] * 50,
+        'webpage_url': 'https://www.youtube.com/watch?v=benchmark',
+    }
+
+
+def recorded_downloader(info_json):
+    """A YoutubeDL that answers RECORDED_URL with a fresh copy of a recorded/synthetic result"""
+    if info_json:
+        with open(info_json) as f:
+            raw = f.read()
+    else:
+        raw = json.dumps(synthetic_info())
+
+    class RecordedIE(InfoExtractor):
+        _VALID_URL = r'recorded:(?P<id>.+)'
+        IE_NAME = 'recorded'
+
+        def _real_extract(self, url):
+            # Parse on every call so each extraction allocates its own dict, like a real one
+            return json.loads(raw)
+
+    class RecordedYoutubeDL(yt_dlp.YoutubeDL):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.add_info_extractor(RecordedIE())
+            # Extractors are tried in order and the catch-all generic one comes first otherwise
+            self._ies = {'Recorded': self._ies.pop('Recorded'), **self._ies}
+
+    return RecordedYoutubeDL
+
+
+def measure(mode, url, info_json, runs, queue):
+    ydl_class = recorded_downloader(info_json) if url == RECORDED_URL else yt_dlp.YoutubeDL
+    ydl_opts = {'quiet': True, 'no_warnings': True, 'skip_download': True}
+
+    def extract():
+        with ydl_class(ydl_opts) as ydl:
+            return extract_projected(ydl, url, mode)
+
+    # Warm up imports, extractor regexes and caches so they don't count
+    extract()
+    gc.collect()
+
+    tracemalloc.start()
+    maxrss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peaks = []
+    retained = []
+    for _ in range(runs):
+        gc.collect()
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = extract()
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - baseline)
+        retained.append(current - baseline)
+        del result
+    maxrss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.stop()
+
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    rss_unit = 1 if sys.platform == 'darwin' else 1024
+    queue.put({
+        'mode': mode,
+        'peak': max(peaks),
+        'retained': max(retained),
+        'rss_growth': (maxrss_after - maxrss_before) * rss_unit,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--url', help='extract this URL live (needs network)')
+    source.add_argument('--info-json', help='replay a yt-dlp -J dump')
+    parser.add_argument('--runs', type=int, default=5, help='measured extractions per mode (default: 5)')
+    args = parser.parse_args()
+
+    url = args.url or RECORDED_URL
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+
+    print(f"{'mode':<6} {'tracemalloc peak':>17} {'retained':>10} {'RSS peak growth':>16}")
+    for mode in EXTRACTION_MODES:
+        process = ctx.Process(target=measure, args=(mode, url, args.info_json, args.runs, queue))
+        process.start()
+        row = queue.get()
+        process.join()
+        print(f"{row['mode']:<6} {row['peak'] / 1024 / 1024:>14.2f} MB {row['retained'] / 1024:>7.1f} KB "
+              f"{row['rss_growth'] / 1024 / 1024:>13.2f} MB")
+
+
+if __name__ == '__main__':
+    main()
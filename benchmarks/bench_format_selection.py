@@ -0,0 +1,110 @@
+"""Compare the cost-aware format selector with the old height-capped format spec
+
+Runs yt-dlp's own format selection (simulate only, nothing is downloaded) over
+recorded format lists and reports the bytes fetched and merges needed per quality.
+
+    python benchmarks/bench_format_selection.py [format_list.json ...]
+
+Format lists are `yt-dlp -J <url>` dumps (only 'duration' and 'formats' are used).
+Merge time is estimated as a fixed ffmpeg start-up cost plus a stream-copy throughput.
+"""
+import os
+import sys
+import glob
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp
+from format_selection import QUALITY_TARGETS, cost_format_selector
+
+FORMAT_LISTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'format_lists', '*.json')
+
+
+def legacy_spec(quality):
+    """The format string app.py used before the selection engine"""
+    height = QUALITY_TARGETS[quality]
+    if height is None:
+        return 'bestvideo+bestaudio/best'
+    return f'bestvideo[height<={height}]+bestaudio/best[height<={height}]'
+
+
+def select(info, fmt):
+    """Run yt-dlp format selection on a recorded info dict, return the selected formats"""
+    ydl_opts = {
+        'format': fmt,
+        'simulate': True,
+        'quiet': True,
+        'no_warnings': True,
+        'merge_output_format': 'mp4'
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = json.loads(json.dumps(info))
+        info.setdefault('webpage_url', info['formats'][0]['url'])
+        info.setdefault('extractor', info.get('extractor_key', 'generic').lower())
+        result = ydl.process_ie_result(info, download=True)
+    return result.get('requested_formats') or [result]
+
+
+def size(fmt, duration):
+    return fmt.get('filesize') or fmt.get('filesize_approx') or int((fmt.get('tbr') or 0) * 1000 / 8 * duration)
+
+
+def merge_seconds(total_bytes, needs_merge, args):
+    if not needs_merge:
+        return 0
+    return args.merge_overhead + total_bytes / (args.merge_throughput * 1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='*', help='format list JSON files (default: benchmarks/format_lists)')
+    parser.add_argument('--merge-throughput', type=float, default=150,
+                        help='ffmpeg stream-copy throughput in MB/s (default: 150)')
+    parser.add_argument('--merge-overhead', type=float, default=0.4,
+                        help='fixed ffmpeg start-up cost per merge in seconds (default: 0.4)')
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(FORMAT_LISTS))
+    totals = {'legacy_bytes': 0, 'engine_bytes': 0, 'legacy_merge': 0.0, 'engine_merge': 0.0,
+              'legacy_merges': 0, 'engine_merges': 0}
+
+    print(f"{'format list':<26} {'quality':<7} {'legacy':<38} {'engine':<38} {'MB saved':>9} {'merge s saved':>14}")
+    for path in files:
+        with open(path) as f:
+            info = json.load(f)
+        duration = info.get('duration') or 0
+        name = os.path.splitext(os.path.basename(path))[0]
+
+        for quality in QUALITY_TARGETS:
+            row = {}
+            for label, fmt in (('legacy', legacy_spec(quality)), ('engine', cost_format_selector(quality))):
+                chosen = select(info, fmt)
+                total = sum(size(f, duration) for f in chosen)
+                merged = len(chosen) > 1
+                totals[f'{label}_bytes'] += total
+                totals[f'{label}_merge'] += merge_seconds(total, merged, args)
+                totals[f'{label}_merges'] += int(merged)
+                row[label] = (
+                    '+'.join(f['format_id'] for f in chosen),
+                    total,
+                    merge_seconds(total, merged, args)
+                )
+
+            print(f"{name:<26} {quality:<7} {row['legacy'][0]:<38} {row['engine'][0]:<38} "
+                  f"{(row['legacy'][1] - row['engine'][1]) / 1024 / 1024:>9.1f} "
+                  f"{row['legacy'][2] - row['engine'][2]:>14.2f}")
+
+    saved = totals['legacy_bytes'] - totals['engine_bytes']
+    print()
+    print(f"Total bytes:  legacy {totals['legacy_bytes'] / 1024 / 1024:.1f} MB, "
+          f"engine {totals['engine_bytes'] / 1024 / 1024:.1f} MB "
+          f"({saved / max(totals['legacy_bytes'], 1) * 100:.1f}% saved)")
+    print(f"Merges:       legacy {totals['legacy_merges']}, engine {totals['engine_merges']}")
+    print(f"Merge time:   legacy {totals['legacy_merge']:.1f} s, engine {totals['engine_merge']:.1f} s "
+          f"({totals['legacy_merge'] - totals['engine_merge']:.1f} s saved)")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,10 @@ echo "=== Building for Vercel deployment ==="
 mkdir -p .vercel/output/static
 mkdir -p .vercel/output/functions/api
 
+# Minify, fingerprint and precompress static assets into static/dist
+echo "Building static assets..."
+python static_assets.py
+
 # Copy static files
 echo "Copying static files..."
 cp -r static .vercel/output/static/
@@ -0,0 +1,119 @@
+import time
+import uuid
+import threading
+
+from failure_guard import suitable_extractor
+from shared_state import worker_id
+
+
+def canonical_video_key(url):
+    """Key that is the same for every URL form of one video, e.g. youtu.be/X and youtube.com/watch?v=X"""
+    ie = suitable_extractor(url)
+    if ie is not None and ie.ie_key() != 'Generic':
+        video_id = ie.get_temp_id(url)
+        if video_id:
+            return f"{ie.ie_key()}:{video_id}"
+    return url
+
+
+class RequestCoalescer:
+    """Let one request per key do the work while concurrent requests wait for its result
+
+    Within a worker, followers wait on an Event. Across workers the leader holds a
+    lease in the state backend and publishes its result there, tagged with the lease,
+    for followers to pick up. All followers of one burst share the leader's deadline.
+    """
+
+    def __init__(self, backend, timeout=30, poll_interval=0.1, stats_key='video_info'):
+        self.backend = backend
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.stats_key = stats_key
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> {'event', 'deadline', 'result'}
+
+    def run(self, key, work, lookup=None):
+        """Return (result, role) where role is 'leader' or 'follower'
+
+        lookup() (optional) returns an already stored result or None. The leader calls
+        it before work(): a request that just missed the cache can become leader right
+        after the previous leader stored its result and left.
+        """
+        with self._lock:
+            local = self._inflight.get(key)
+            if local is None:
+                local = {'event': threading.Event(), 'deadline': time.time() + self.timeout, 'result': None}
+                self._inflight[key] = local
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            return self._follow_local(local), 'follower'
+
+        try:
+            # Only one worker process should extract; the others follow through the backend
+            lease = {'id': uuid.uuid4().hex, 'owner': worker_id(), 'deadline': local['deadline']}
+            if self.backend.add('inflight', key, lease, ttl=self.timeout):
+                # Followers only take results of the lease they waited on, but don't leave
+                # the previous burst's result lying around either
+                self.backend.delete('inflight_result', key)
+                try:
+                    local['result'] = lookup() if lookup is not None else None
+                    if local['result'] is None:
+                        self.backend.incr('stats', self.stats_key, 'leaders')
+                        local['result'] = work()
+                    # Errors aren't cached elsewhere, so publish every result for remote followers
+                    self.backend.set('inflight_result', key, {'lease': lease['id'], 'result': local['result']},
+                                     ttl=self.timeout)
+                finally:
+                    # The lease may have expired and been taken by another worker meanwhile
+                    self.backend.delete_if('inflight', key, lambda current: current.get('id') == lease['id'])
+                role = 'leader'
+            else:
+                local['result'] = self._follow_remote(key)
+                role = 'follower'
+            return local['result'], role
+        finally:
+            local['event'].set()
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _follow_local(self, local):
+        self.backend.incr('stats', self.stats_key, 'followers')
+        if not local['event'].wait(max(0, local['deadline'] - time.time())) or local['result'] is None:
+            return self._timed_out()
+        return local['result']
+
+    def _follow_remote(self, key):
+        self.backend.incr('stats', self.stats_key, 'followers')
+        lease = self.backend.get('inflight', key)
+        if lease is None:
+            # The leader finished between our add() and now, so the stored result is its own
+            published = self.backend.get('inflight_result', key)
+            return published['result'] if published else self._timed_out()
+        while time.time() < lease['deadline']:
+            result = self._published(key, lease)
+            if result is not None:
+                return result
+            current = self.backend.get('inflight', key)
+            if current is None or current.get('id') != lease.get('id'):
+                # The leader finished (or died); its result may have landed just now
+                return self._published(key, lease) or self._timed_out()
+            time.sleep(self.poll_interval)
+        return self._timed_out()
+
+    def _published(self, key, lease):
+        """The result published under this lease, or None (a stored one may be from an earlier burst)"""
+        published = self.backend.get('inflight_result', key)
+        if published is not None and published.get('lease') == lease.get('id'):
+            return published['result']
+        return None
+
+    def _timed_out(self):
+        self.backend.incr('stats', self.stats_key, 'follower_timeouts')
+        return {
+            'status': 'error',
+            'error': 'Timed out waiting for another request to fetch this video',
+            'error_type': 'coalesce_timeout'
+        }
@@ -0,0 +1,156 @@
+import os
+import time
+
+from yt_dlp.extractor import gen_extractor_classes
+from yt_dlp.networking.exceptions import HTTPError, TransportError
+from yt_dlp.utils import ExtractorError
+
+# How long a classified failure is remembered for a URL (seconds)
+NEGATIVE_CACHE_TTLS = {
+    'private': int(os.environ.get('NEGATIVE_TTL_PRIVATE', 10 * 60)),
+    'unavailable': int(os.environ.get('NEGATIVE_TTL_UNAVAILABLE', 10 * 60)),
+    'geo_blocked': int(os.environ.get('NEGATIVE_TTL_GEO_BLOCKED', 10 * 60)),
+    'rate_limited': int(os.environ.get('NEGATIVE_TTL_RATE_LIMITED', 60)),
+}
+
+# Consecutive failures before an extractor's breaker opens, and how long it stays open
+BREAKER_THRESHOLD = int(os.environ.get('BREAKER_THRESHOLD', 5))
+BREAKER_COOLDOWN = int(os.environ.get('BREAKER_COOLDOWN', 30))
+
+# Error message fragments from yt-dlp, checked in order (geo messages also say "not available")
+ERROR_PATTERNS = [
+    ('geo_blocked', ('not available in your country', 'blocked it in your country', 'geo restrict', 'geo-restrict')),
+    ('rate_limited', ('http error 429', 'too many requests', 'rate-limit', 'rate limit', "confirm you're not a bot")),
+    ('private', ('private video', 'members-only', 'sign in to confirm your age', 'requires authentication')),
+    ('unavailable', ('video unavailable', 'has been removed', 'no longer available', 'is not available',
+                     'does not exist', 'http error 404', 'account associated with this video has been terminated')),
+]
+
+# Classes that say something about the video itself rather than the extractor's health
+VIDEO_ERRORS = ('private', 'unavailable', 'geo_blocked')
+
+
+def classify_error(message):
+    """Map a yt-dlp error message to a failure class, or None if it looks transient"""
+    message = (message or '').lower()
+    for kind, fragments in ERROR_PATTERNS:
+        if any(fragment in message for fragment in fragments):
+            return kind
+    return None
+
+
+def _causes(error):
+    """The error and every exception yt-dlp wrapped inside it"""
+    pending, found = [error], []
+    while pending:
+        current = pending.pop()
+        if not isinstance(current, BaseException) or any(current is seen for seen in found):
+            continue
+        found.append(current)
+        exc_info = getattr(current, 'exc_info', None)
+        pending += [exc_info[1] if exc_info else None, getattr(current, 'cause', None),
+                    current.__cause__, current.__context__]
+    return found
+
+
+def counts_against_extractor(error):
+    """True if an extraction error says the extractor or its site is broken
+
+    Upstream 5xx responses and unexpected extractor errors (typically a site change
+    breaking the parser) count. Errors about the request don't, so junk URLs can't
+    open a breaker: unsupported URLs, DRM and anything else yt-dlp raises as expected,
+    other HTTP errors, and unreachable hosts (e.g. DNS failures for mistyped ones).
+    """
+    causes = _causes(error)
+    for cause in causes:
+        if isinstance(cause, HTTPError):
+            return cause.status >= 500
+    for cause in causes:
+        if isinstance(cause, TransportError) or (isinstance(cause, ExtractorError) and cause.expected):
+            return False
+    return True
+
+
+def suitable_extractor(url):
+    """The yt-dlp extractor class that handles this URL (regexes are compiled once per process)"""
+    for ie in gen_extractor_classes():
+        if ie.suitable(url):
+            return ie
+    return None
+
+
+def extractor_key(url):
+    """Name of the yt-dlp extractor that handles this URL"""
+    ie = suitable_extractor(url)
+    return ie.ie_key() if ie is not None else 'Generic'
+
+
+class NegativeCache:
+    """Remember URLs that recently failed with a classified error"""
+
+    def __init__(self, backend, ttls=None):
+        self.backend = backend
+        self.ttls = ttls or NEGATIVE_CACHE_TTLS
+
+    def get(self, key):
+        return self.backend.get('negative', key)
+
+    def put(self, key, error):
+        """Cache the error if it is classified, return its class"""
+        kind = classify_error(error)
+        if kind is not None:
+            self.backend.set('negative', key, {
+                'error': error,
+                'error_type': kind,
+                'expires': time.time() + self.ttls[kind]
+            }, ttl=self.ttls[kind])
+        return kind
+
+
+class CircuitBreaker:
+    """Per-extractor breaker: fail fast after repeated errors, then probe for recovery
+
+    closed    -> requests pass, consecutive failures are counted
+    open      -> requests are rejected until the cooldown is over
+    half-open -> a single probe request is let through; success closes, failure reopens
+    """
+
+    def __init__(self, backend, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.backend = backend
+        self.threshold = threshold
+        self.cooldown = cooldown
+
+    def allow(self, extractor):
+        """Return (allowed, retry_after_seconds)"""
+        state = self.backend.get('breaker', extractor)
+        if not state or state.get('state') != 'open':
+            return True, 0
+
+        retry_after = state['opened_at'] + self.cooldown - time.time()
+        if retry_after > 0:
+            return False, int(retry_after) + 1
+
+        # Half-open: only one worker gets to probe, the rest keep failing fast
+        if self.backend.add('breaker_probe', extractor, {'started': time.time()}, ttl=self.cooldown):
+            return True, 0
+        return False, self.cooldown
+
+    def record_success(self, extractor):
+        state = self.backend.get('breaker', extractor)
+        if state and (state.get('failures') or state.get('state') == 'open'):
+            self.backend.delete('breaker', extractor)
+            self.backend.delete('breaker_probe', extractor)
+
+    def record_failure(self, extractor):
+        # Counts may be slightly off when workers race; the threshold only needs to be approximate
+        state = self.backend.get('breaker', extractor) or {}
+        failures = state.get('failures', 0) + 1
+        fields = {'failures': failures}
+        if state.get('state') == 'open' or failures >= self.threshold:
+            # Either the half-open probe failed or we just crossed the threshold
+            fields.update({'state': 'open', 'opened_at': time.time()})
+            self.backend.delete('breaker_probe', extractor)
+        self.backend.update('breaker', extractor, fields)
+
+    def status(self, extractor):
+        return self.backend.get('breaker', extractor) or {'state': 'closed', 'failures': 0}
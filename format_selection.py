@@ -0,0 +1,266 @@
+import os
+
+# Audio targets accepted by /api/download: codec -> (source acodec prefixes that can be
+# kept without transcoding, source container preferred when several streams fit)
+AUDIO_TARGETS = {
+    'best': ((), None),
+    'm4a': (('mp4a', 'aac'), 'm4a'),
+    'aac': (('mp4a', 'aac'), 'm4a'),
+    'opus': (('opus',), 'webm'),
+    'vorbis': (('vorbis',), 'ogg'),
+    'mp3': (('mp3',), 'mp3'),
+    'flac': (('flac',), 'flac'),
+}
+
+
+def has_audio(fmt):
+    return fmt.get('acodec') not in (None, 'none')
+
+
+def has_video(fmt):
+    return fmt.get('vcodec') not in (None, 'none')
+
+
+def is_audio_only(fmt):
+    return has_audio(fmt) and fmt.get('vcodec') == 'none'
+
+
+def audio_bitrate(fmt):
+    """Audio bitrate in kbps (falls back to the total bitrate for audio-only streams)"""
+    return fmt.get('abr') or fmt.get('tbr') or 0
+
+
+def select_audio_format(formats, codec='best', bitrate=None):
+    """Pick the audio-only stream that best fits the target codec and bitrate
+
+    Streams already in the target codec win (they only need a remux), then the
+    smallest stream at or above the target bitrate, else the largest one below it.
+    Without a target bitrate the highest bitrate stream is used.
+    """
+    candidates = [fmt for fmt in formats if is_audio_only(fmt)]
+    if not candidates:
+        return None
+
+    codecs, container = AUDIO_TARGETS.get(codec, ((), None))
+
+    def score(fmt):
+        acodec = (fmt.get('acodec') or '').lower()
+        codec_mismatch = bool(codecs) and not acodec.startswith(codecs)
+        abr = audio_bitrate(fmt)
+        if bitrate:
+            fit = (0, abr - bitrate) if abr >= bitrate else (1, bitrate - abr)
+        else:
+            fit = (0, -abr)
+        return (codec_mismatch, fit, container is not None and fmt.get('ext') != container)
+
+    return min(candidates, key=score)
+
+
+def audio_format_selector(codec='best', bitrate=None):
+    """Build a yt-dlp 'format' callable that selects a single audio stream"""
+    def selector(ctx):
+        fmt = select_audio_format(ctx['formats'], codec, bitrate)
+        if fmt is None:
+            # No separate audio stream (e.g. progressive-only sites): take the smallest format with audio
+            with_audio = [f for f in ctx['formats'] if has_audio(f)] or ctx['formats']
+            if not with_audio:
+                return
+            fmt = min(with_audio, key=lambda f: f.get('filesize') or f.get('filesize_approx') or float('inf'))
+        yield fmt
+    return selector
+
+
+# User-level quality targets accepted by /api/download -> maximum height (None = no limit)
+QUALITY_TARGETS = {
+    'best': None,
+    '1080p': 1080,
+    '720p': 720,
+    '480p': 480,
+    '360p': 360,
+}
+
+# A merge costs an extra request plus an ffmpeg pass over every byte, expressed here as
+# a fraction of the bytes fetched so it can be weighed against larger progressive streams
+MERGE_COST = float(os.environ.get('FORMAT_MERGE_COST', 0.25))
+
+# Relative weight per video codec. Everything is merged/remuxed into mp4, where AV1 and
+# less common codecs play back on fewer devices
+CODEC_WEIGHTS = {
+    'avc1': 1.0,
+    'h264': 1.0,
+    'vp9': 1.0,
+    'vp09': 1.0,
+    'av01': 1.1,
+}
+OTHER_CODEC_WEIGHT = 1.2
+
+
+def estimate_bytes(fmt, duration=None):
+    """Best guess at a format's size: exact, approximate, or bitrate x duration"""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return size
+    if fmt.get('tbr') and duration:
+        return int(fmt['tbr'] * 1000 / 8 * duration)
+    return None
+
+
+def codec_weight(fmt):
+    vcodec = (fmt.get('vcodec') or '').lower()
+    for prefix, weight in CODEC_WEIGHTS.items():
+        if vcodec.startswith(prefix):
+            return weight
+    return OTHER_CODEC_WEIGHT
+
+
+def _usable(fmt):
+    # Storyboards and other image-only "formats" are not downloads
+    return fmt.get('ext') != 'mhtml' and (has_video(fmt) or has_audio(fmt))
+
+
+def choose_format(formats, quality='best', duration=None):
+    """Pick the cheapest way to get the best height allowed by the quality target
+
+    Candidates are progressive streams (video + audio in one file) and pairs of a
+    video-only stream with the best m4a/audio-only stream. The highest height that
+    fits the target wins (the smallest one above it if none fits); among those, the
+    lowest estimated bytes after codec and merge penalties. Returns a dict with the
+    chosen 'formats' and their cost, or None.
+    """
+    max_height = QUALITY_TARGETS.get(quality)
+    formats = [fmt for fmt in formats if _usable(fmt)]
+    audio = select_audio_format(formats, 'm4a')
+
+    def playable(fits):
+        # Each video stream on its own if it has audio, else paired with the audio stream
+        found = []
+        for index, fmt in enumerate(formats):
+            if not has_video(fmt) or not fits(fmt.get('height') or 0):
+                continue
+            if has_audio(fmt):
+                found.append((index, [fmt]))
+            elif audio is not None:
+                found.append((index, [fmt, audio]))
+        return found
+
+    candidates = playable(lambda height: not max_height or height <= max_height)
+    target_height = max((parts[0].get('height') or 0 for _, parts in candidates), default=0)
+
+    if not candidates:
+        # Nothing small enough: take the smallest height above the target
+        candidates = playable(lambda height: True)
+        target_height = min((parts[0].get('height') or 0 for _, parts in candidates), default=0)
+
+    if not candidates:
+        # Audio-only sites: the cheapest thing with audio
+        candidates = [(i, [fmt]) for i, fmt in enumerate(formats) if has_audio(fmt)]
+        if not candidates:
+            return None
+
+    best = None
+    for index, parts in candidates:
+        if (parts[0].get('height') or 0) != target_height:
+            continue
+        sizes = [estimate_bytes(fmt, duration) for fmt in parts]
+        size = sum(sizes) if all(sizes) else None
+        needs_merge = len(parts) > 1
+        if size is not None:
+            cost = size * codec_weight(parts[0]) * (1 + MERGE_COST if needs_merge else 1)
+        else:
+            cost = float('inf')
+        # Unknown sizes tie; yt-dlp lists formats worst to best, so prefer the later one
+        key = (cost, -index)
+        if best is None or key < best[0]:
+            best = (key, {
+                'formats': parts,
+                'estimated_bytes': size,
+                'needs_merge': needs_merge,
+                'height': parts[0].get('height'),
+                'quality': quality
+            })
+    return best[1]
+
+
+def describe_choice(choice):
+    """JSON-friendly summary of a choose_format() result"""
+    if choice is None:
+        return None
+    parts = choice['formats']
+    video = next((fmt for fmt in parts if has_video(fmt)), parts[0])
+    audio = next((fmt for fmt in parts if has_audio(fmt)), None)
+    return {
+        'format_id': '+'.join(fmt['format_id'] for fmt in parts),
+        'ext': 'mp4' if choice['needs_merge'] else video.get('ext'),
+        'height': choice['height'],
+        'vcodec': video.get('vcodec'),
+        'acodec': audio.get('acodec') if audio else None,
+        'needs_merge': choice['needs_merge'],
+        'estimated_bytes': choice['estimated_bytes'],
+        'quality': choice['quality']
+    }
+
+
+def describe_result(info, quality):
+    """describe_choice()-style summary of the format(s) yt-dlp actually downloaded
+
+    For jobs whose format wasn't picked by choose_format (audio, raw format specs, fallbacks).
+    """
+    parts = info.get('requested_formats') or [info]
+    video = next((fmt for fmt in parts if has_video(fmt)), parts[0])
+    audio = next((fmt for fmt in parts if has_audio(fmt)), None)
+    sizes = [fmt.get('filesize') or fmt.get('filesize_approx') for fmt in parts]
+    return {
+        'format_id': info.get('format_id'),
+        'ext': info.get('ext'),
+        'height': video.get('height'),
+        'vcodec': video.get('vcodec'),
+        'acodec': audio.get('acodec') if audio else None,
+        'needs_merge': len(parts) > 1,
+        'estimated_bytes': sum(sizes) if all(sizes) else None,
+        'quality': quality
+    }
+
+
+def merged_format(parts, ext='mp4'):
+    """Combine a video-only and an audio-only format the way yt-dlp's own selector does"""
+    if len(parts) == 1:
+        return parts[0]
+    video, audio = parts
+    sizes = [fmt.get('filesize') or fmt.get('filesize_approx') for fmt in parts]
+    return {
+        'requested_formats': parts,
+        'format': '+'.join(fmt.get('format') or fmt['format_id'] for fmt in parts),
+        'format_id': '+'.join(fmt['format_id'] for fmt in parts),
+        'ext': ext,
+        'protocol': '+'.join(fmt.get('protocol') or 'https' for fmt in parts),
+        'filesize_approx': sum(sizes) if all(sizes) else None,
+        'tbr': sum(fmt.get('tbr') or 0 for fmt in parts) or None,
+        'width': video.get('width'),
+        'height': video.get('height'),
+        'fps': video.get('fps'),
+        'vcodec': video.get('vcodec'),
+        'acodec': audio.get('acodec'),
+        'abr': audio.get('abr'),
+    }
+
+
+def cost_format_selector(quality='best', on_choice=None):
+    """Build a yt-dlp 'format' callable around choose_format()
+
+    on_choice is called with describe_choice() before anything is downloaded,
+    so the chosen format and its size can be reported up front.
+    """
+    def selector(ctx):
+        # yt-dlp has already filled filesize_approx from tbr x duration where it can
+        choice = choose_format(ctx['formats'], quality)
+        if choice is None:
+            # No codec info to cost (e.g. a direct link to a media file), take yt-dlp's best
+            max_height = QUALITY_TARGETS.get(quality)
+            fallback = [fmt for fmt in ctx['formats'] if not max_height or (fmt.get('height') or 0) <= max_height]
+            if fallback:
+                yield fallback[-1]
+            return
+        if on_choice is not None:
+            on_choice(describe_choice(choice))
+        yield merged_format(choice['formats'])
+    return selector
@@ -0,0 +1,59 @@
+import os
+import glob
+import time
+
+from yt_dlp.utils import DownloadCancelled
+
+# Cancel a running job when nobody has polled its progress for this long (seconds, 0 = never)
+ABANDON_AFTER = int(os.environ.get('ABANDON_AFTER', 0))
+
+# Job states that can't be paused or cancelled any more
+FINAL_STATUSES = ('complete', 'error', 'cancelled')
+
+
+class JobInterrupted(DownloadCancelled):
+    """Raised from a yt-dlp hook to stop a job; yt-dlp lets DownloadCancelled propagate"""
+
+    def __init__(self, action, reason=None):
+        self.action = action  # 'pause' or 'cancel'
+        self.reason = reason or f'{action} requested'
+        super().__init__(f'Download interrupted: {self.reason}')
+
+
+def check_interrupt(entry):
+    """Raise JobInterrupted if the job's progress entry asks it to stop
+
+    The entry lives in the shared state backend, so any worker can set 'control'
+    and the worker running the job notices on its next progress update.
+    """
+    if not entry:
+        return
+    if entry.get('control') in ('pause', 'cancel'):
+        raise JobInterrupted(entry['control'])
+    if ABANDON_AFTER and not entry.get('unattended'):
+        last_seen = entry.get('last_polled') or entry.get('created') or time.time()
+        if time.time() - last_seen > ABANDON_AFTER:
+            raise JobInterrupted('cancel', f'no progress polls for {ABANDON_AFTER} seconds')
+
+
+def transfer_complete(d):
+    """True on a file's last progress update, before yt-dlp renames its .part file
+
+    Stopping there leaves a complete .part that some servers refuse to resume (416).
+    """
+    return bool(d.get('downloaded_bytes')) and d['downloaded_bytes'] == d.get('total_bytes')
+
+
+def remove_partial_files(paths):
+    """Delete the (partial) files a job downloaded, including fragment leftovers"""
+    removed = []
+    for path in paths or []:
+        for name in [path, path + '.ytdl'] + glob.glob(glob.escape(path) + '-Frag*'):
+            try:
+                os.remove(name)
+                removed.append(os.path.basename(name))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Could not remove {name}: {str(e)}")
+    return removed
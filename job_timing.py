@@ -0,0 +1,191 @@
+import os
+import time
+
+# Stages a download job goes through, in order
+STAGES = ('queued', 'extracting', 'downloading', 'post_processing', 'uploading', 'complete')
+
+# How many jobs /api/jobs keeps; the oldest finished ones are dropped beyond this
+JOB_HISTORY_SIZE = int(os.environ.get('JOB_HISTORY_SIZE', 500))
+
+# Progress entry fields that make up a job's history record (speed, eta etc. are live-only)
+JOB_FIELDS = (
+    'status', 'url', 'extractor', 'created', 'title', 'filename', 'requested_quality',
+    'chosen_format', 'error', 'timing'
+)
+
+FINISHED_STATUSES = ('complete', 'error', 'cancelled')
+
+
+class JobTimer:
+    """Record when each stage of a download job starts, how long it takes and how many bytes it moves
+
+    Offsets and durations are measured with time.monotonic() in the worker running the
+    job, so clock adjustments don't skew them. They're written to the job's progress
+    entry under 'timing' as stages change, so any worker can report them.
+
+    A resumed job passes its previous timing and continues from it; time spent
+    paused isn't counted.
+    """
+
+    def __init__(self, progress, job_id, started=None, previous=None):
+        self.progress = progress
+        self.job_id = job_id
+        previous = previous or {'stages': [], 'total': 0.0, 'postprocessors': []}
+        # The job starts out queued, from when the request arrived (before admission) if known
+        self.origin = (started if started is not None else time.monotonic()) - previous['total']
+        self.stages = previous['stages'] + [
+            {'stage': 'queued', 'start': previous['total'], 'duration': None, 'bytes': None}
+        ]
+        self.downloaded = {}  # filename -> bytes received so far
+        self.steps = previous['postprocessors']  # post-processors that ran
+        self.failed_stage = None
+        self.interrupted = None
+        self._save()
+
+    @property
+    def stage(self):
+        return self.stages[-1]['stage']
+
+    def _now(self):
+        return round(time.monotonic() - self.origin, 3)
+
+    def _close(self, bytes_moved=None):
+        current = self.stages[-1]
+        if current['duration'] is None:
+            current['duration'] = round(self._now() - current['start'], 3)
+            current['bytes'] = bytes_moved
+
+    def _stage_bytes(self):
+        if self.stage == 'downloading':
+            return sum(self.downloaded.values())
+        return None
+
+    def enter(self, stage, bytes_moved=None):
+        """Finish the current stage and start the next one; 'complete' finishes immediately"""
+        if stage == self.stage:
+            return
+        self._close(self._stage_bytes())
+        self.stages.append({'stage': stage, 'start': self._now(), 'duration': None, 'bytes': None})
+        if stage == 'complete':
+            self._close(bytes_moved)
+        self._save()
+
+    def fail(self):
+        """Finish the current stage and record it as the one the job failed in"""
+        self.failed_stage = self.stage
+        self._close(self._stage_bytes())
+        self._save()
+
+    def interrupt(self, action):
+        """Finish the current stage because the job was paused or cancelled"""
+        self.interrupted = action
+        self._close(self._stage_bytes())
+        self._save()
+
+    def download_hook(self, d):
+        """yt-dlp progress hook: count bytes per file (a merged download has several)"""
+        if d.get('status') in ('downloading', 'finished'):
+            self.enter('downloading')
+            received = d.get('downloaded_bytes') or d.get('total_bytes')
+            if received:
+                self.downloaded[d.get('filename', '')] = received
+
+    def postprocessor_hook(self, d):
+        """yt-dlp postprocessor hook: merging, audio extraction, moving files etc."""
+        if d.get('status') == 'started':
+            self.enter('post_processing')
+            self.steps.append(d.get('postprocessor'))
+
+    def finish(self, filepath=None, upload=None):
+        """Complete the job; upload() (if given) runs as the 'uploading' stage first"""
+        size = None
+        if filepath and os.path.exists(filepath):
+            size = os.path.getsize(filepath)
+        if self.stage == 'post_processing':
+            # Post-processing produced the final file
+            self._close(size)
+        if upload is not None:
+            self.enter('uploading')
+            upload()
+            self._close(size)
+        self.enter('complete', size)
+
+    def timing(self):
+        return {
+            'stage': self.stage,
+            'stages': self.stages,
+            'total': self._now() if self.stage != 'complete' else self.stages[-1]['start'],
+            'downloaded_bytes': sum(self.downloaded.values()),
+            'postprocessors': self.steps,
+            'failed_stage': self.failed_stage,
+            'interrupted': self.interrupted
+        }
+
+    def _save(self):
+        self.progress.merge(self.job_id, {'timing': self.timing()})
+
+
+def job_record(job_id, entry):
+    """The /api/jobs view of a progress entry"""
+    record = {field: entry.get(field) for field in JOB_FIELDS}
+    record['id'] = job_id
+    return record
+
+
+def list_jobs(progress, limit=None):
+    """All known jobs, newest first"""
+    jobs = []
+    for job_id in progress.keys():
+        entry = progress.get(job_id)
+        if entry is not None:
+            jobs.append(job_record(job_id, entry))
+    jobs.sort(key=lambda job: job.get('created') or 0, reverse=True)
+    return jobs[:limit] if limit else jobs
+
+
+def prune_jobs(progress, keep=JOB_HISTORY_SIZE):
+    """Drop the oldest finished jobs beyond `keep` (running jobs are never dropped)"""
+    jobs = list_jobs(progress)
+    finished = [job for job in jobs if job['status'] in FINISHED_STATUSES]
+    excess = len(jobs) - keep
+    for job in reversed(finished):
+        if excess <= 0:
+            break
+        del progress[job['id']]
+        excess -= 1
+
+
+def stage_summary(jobs):
+    """Mean seconds and bytes per stage, per extractor, over finished jobs"""
+    totals = {}
+    for job in jobs:
+        timing = job.get('timing')
+        if job['status'] not in FINISHED_STATUSES or not timing:
+            continue
+        # A resumed job goes through some stages more than once, count them once per job.
+        # Byte counts of a resumed download already include what was fetched before the pause
+        job_stages = {}
+        for stage in timing['stages']:
+            if stage['duration'] is None:
+                continue
+            seconds, moved = job_stages.get(stage['stage'], (0.0, 0))
+            job_stages[stage['stage']] = (seconds + stage['duration'], max(moved, stage['bytes'] or 0))
+
+        per_stage = totals.setdefault(job.get('extractor') or 'unknown', {})
+        for stage, (seconds, moved) in job_stages.items():
+            total = per_stage.setdefault(stage, {'jobs': 0, 'seconds': 0.0, 'bytes': 0})
+            total['jobs'] += 1
+            total['seconds'] += seconds
+            total['bytes'] += moved
+
+    return {
+        extractor: {
+            stage: {
+                'jobs': total['jobs'],
+                'mean_seconds': round(total['seconds'] / total['jobs'], 3),
+                'mean_bytes': int(total['bytes'] / total['jobs'])
+            }
+            for stage, total in sorted(per_stage.items(), key=lambda item: STAGES.index(item[0]))
+        }
+        for extractor, per_stage in totals.items()
+    }
@@ -0,0 +1,134 @@
+import os
+import mimetypes
+from urllib.parse import quote
+
+# boto3 is optional - only needed when STORAGE_BACKEND=s3
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.exceptions import ClientError
+    BOTO3_AVAILABLE = True
+except ImportError:
+    BOTO3_AVAILABLE = False
+
+# Multipart upload tuning: part size (also the threshold for going multipart) and parallel parts
+S3_MULTIPART_CHUNK = int(os.environ.get('S3_MULTIPART_CHUNK', 16 * 1024 * 1024))
+S3_UPLOAD_CONCURRENCY = int(os.environ.get('S3_UPLOAD_CONCURRENCY', 8))
+
+# How long a presigned download link stays valid (seconds)
+S3_PRESIGN_TTL = int(os.environ.get('S3_PRESIGN_TTL', 60 * 60))
+
+# Drop the local copy once it's uploaded, so disk use stays flat
+S3_DELETE_LOCAL = os.environ.get('S3_DELETE_LOCAL', 'true').lower() in ('1', 'true', 'yes')
+
+
+class LocalStorage:
+    """Finished files stay in downloads_folder and Flask serves them"""
+
+    remote = False
+
+    def upload(self, path, name):
+        pass
+
+    def exists(self, name):
+        return False
+
+    def download_url(self, name):
+        return None
+
+    def list(self):
+        return []
+
+
+class S3Storage:
+    """Finished files go to an S3-compatible bucket; clients download them straight from it"""
+
+    remote = True
+
+    def __init__(self, client, bucket, prefix='downloads/', delete_local=S3_DELETE_LOCAL):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.delete_local = delete_local
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_CHUNK,
+            multipart_chunksize=S3_MULTIPART_CHUNK,
+            max_concurrency=S3_UPLOAD_CONCURRENCY,
+            use_threads=True
+        )
+
+    def _key(self, name):
+        return self.prefix + name
+
+    def upload(self, path, name):
+        """Upload a finished file (multipart, parts in parallel for large files)"""
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.client.upload_file(
+            path, self.bucket, self._key(name),
+            ExtraArgs={'ContentType': content_type},
+            Config=self.transfer_config
+        )
+        if self.delete_local:
+            os.remove(path)
+
+    def exists(self, name):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def download_url(self, name):
+        """A presigned GET URL that makes browsers save the file under its own name"""
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={
+                'Bucket': self.bucket,
+                'Key': self._key(name),
+                'ResponseContentDisposition': f"attachment; filename*=UTF-8''{quote(name)}"
+            },
+            ExpiresIn=S3_PRESIGN_TTL
+        )
+
+    def list(self):
+        files = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get('Contents', []):
+                files.append({
+                    'name': obj['Key'][len(self.prefix):],
+                    'size': obj['Size'],
+                    'created': obj['LastModified'].timestamp()
+                })
+        return files
+
+
+def create_storage(kind=None):
+    """Create the storage for finished downloads selected by STORAGE_BACKEND
+
+    - local: keep files in the downloads folder and serve them through Flask (default)
+    - s3:    upload them to S3_BUCKET and redirect downloads to presigned URLs.
+             S3_ENDPOINT_URL points at any S3-compatible service (MinIO, R2, moto);
+             credentials come from the usual AWS_* environment variables
+    """
+    kind = (kind or os.environ.get('STORAGE_BACKEND', 'local')).lower()
+
+    if kind == 'local':
+        return LocalStorage()
+
+    if kind == 's3':
+        if not BOTO3_AVAILABLE:
+            raise RuntimeError('STORAGE_BACKEND=s3 requires the boto3 package (pip install boto3)')
+        bucket = os.environ.get('S3_BUCKET')
+        if not bucket:
+            raise RuntimeError('STORAGE_BACKEND=s3 requires S3_BUCKET')
+        client = boto3.client(
+            's3',
+            endpoint_url=os.environ.get('S3_ENDPOINT_URL') or None,
+            region_name=os.environ.get('S3_REGION') or None
+        )
+        return S3Storage(client, bucket, prefix=os.environ.get('S3_PREFIX', 'downloads/'))
+
+    raise ValueError(f"Unknown STORAGE_BACKEND: {kind}")
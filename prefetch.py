@@ -0,0 +1,272 @@
+import os
+import time
+import threading
+
+import yt_dlp
+from yt_dlp.utils import DownloadCancelled
+
+from format_selection import QUALITY_TARGETS, cost_format_selector
+from job_control import remove_partial_files, transfer_complete
+from shared_state import worker_id
+
+# Speculative prefetch is off unless PREFETCH is set
+PREFETCH_ENABLED = os.environ.get('PREFETCH', '').lower() in ('1', 'true', 'yes')
+
+# At most this many bytes per video, and this many speculative bytes on disk across all workers
+PREFETCH_MAX_BYTES = int(os.environ.get('PREFETCH_MAX_BYTES', 32 * 1024 * 1024))
+PREFETCH_BUDGET_BYTES = int(os.environ.get('PREFETCH_BUDGET_BYTES', 256 * 1024 * 1024))
+
+# Bandwidth cap per prefetch (bytes per second), so real downloads keep priority
+PREFETCH_RATE = int(os.environ.get('PREFETCH_RATE', 2 * 1024 * 1024))
+
+# Unused prefetched bytes are deleted this long after the prefetch stops (seconds)
+PREFETCH_TTL = int(os.environ.get('PREFETCH_TTL', 120))
+
+# How long a real download waits for a running prefetch of the same video to stop (seconds)
+PREFETCH_ADOPT_TIMEOUT = float(os.environ.get('PREFETCH_ADOPT_TIMEOUT', 10))
+
+# Quality to prefetch when neither the client nor past downloads suggest one (the UI default)
+PREFETCH_DEFAULT_QUALITY = os.environ.get('PREFETCH_DEFAULT_QUALITY', 'best')
+
+
+class PrefetchStopped(DownloadCancelled):
+    """Raised from a yt-dlp hook to end a prefetch; the partial files stay for adoption"""
+
+
+class Prefetcher:
+    """Start downloading the likely format of a video before the user asks for it
+
+    The prefetch writes to the same files the real download would (same outtmpl and
+    format selection), stops at PREFETCH_MAX_BYTES and never post-processes. The real
+    download then simply resumes from those files (see adopt()). Prefetch state lives
+    in the state backend under the canonical video key, so any worker can adopt it.
+
+    Real downloads claim the video key while they write (see claim()), and no prefetch
+    starts while a claim is held. Claims are kept with prefetching off too, so a
+    cancelled job can tell whether another one still uses its files. claim_ttl bounds
+    how long a claim can outlive a worker that died without releasing it.
+
+    The prefetch extracts the video again (the info the request returned is projected
+    and format URLs expire). guard(url, key) returns an error to skip that extraction,
+    e.g. while the extractor is failing, and record(url, key, error) reports its
+    outcome (error is None on success) so prefetch failures count like any other.
+    """
+
+    def __init__(self, backend, outtmpl, claim_ttl=24 * 60 * 60, guard=None, record=None):
+        self.backend = backend
+        self.outtmpl = outtmpl
+        self.claim_ttl = claim_ttl
+        self.guard = guard
+        self.record = record
+
+    def likely_quality(self, hint=None):
+        """The quality the user will probably download: their pick, else the most common one"""
+        if hint in QUALITY_TARGETS:
+            return hint
+        choices = self.backend.get('stats', 'download_choices') or {}
+        choices = {quality: count for quality, count in choices.items() if quality in QUALITY_TARGETS}
+        if choices:
+            return max(choices, key=choices.get)
+        return PREFETCH_DEFAULT_QUALITY
+
+    def record_choice(self, quality):
+        if quality in QUALITY_TARGETS:
+            self.backend.incr('stats', 'download_choices', quality)
+
+    def _reserve(self, key):
+        """Reserve PREFETCH_MAX_BYTES of the shared budget for key, return False if it's used up"""
+        now = time.time()
+
+        def change(reserved):
+            # Reservations expire on their own, so a worker dying mid-prefetch can't leak budget
+            for other in [k for k, (_, expires) in reserved.items() if expires <= now]:
+                del reserved[other]
+            in_use = sum(size for size, _ in reserved.values())
+            if in_use + PREFETCH_MAX_BYTES <= PREFETCH_BUDGET_BYTES:
+                reserved[key] = (PREFETCH_MAX_BYTES, now + 2 * PREFETCH_TTL)
+
+        reserved = self.backend.modify('prefetch_budget', 'reserved', change)
+        return key in reserved
+
+    def _release(self, key):
+        self.backend.modify('prefetch_budget', 'reserved', lambda reserved: reserved.pop(key, None))
+
+    def claim(self, key, download_id):
+        """Record that a real download writes this video's files (paused ones still count)"""
+        now = time.time()
+
+        def change(writers):
+            # Claims of workers that died without releasing them expire on their own
+            for other in [k for k, expires in writers.items() if expires <= now]:
+                del writers[other]
+            writers[download_id] = now + self.claim_ttl
+
+        self.backend.modify('writers', key, change, ttl=self.claim_ttl)
+
+    def release(self, key, download_id):
+        self.backend.modify('writers', key, lambda writers: writers.pop(download_id, None), ttl=self.claim_ttl)
+
+    def claimed(self, key, exclude=None):
+        """True if a download (other than exclude) holds a claim on this video"""
+        writers = self.backend.get('writers', key) or {}
+        return any(expires > time.time() for writer, expires in writers.items() if writer != exclude)
+
+    def start(self, url, key, hint=None):
+        """Prefetch the likely format of a video in the background, if enabled and within budget"""
+        if not PREFETCH_ENABLED:
+            return
+        if self.guard is not None and self.guard(url, key) is not None:
+            self.backend.incr('stats', 'prefetch', 'skipped_guard')
+            return
+        quality = self.likely_quality(hint)
+        entry = {'status': 'running', 'quality': quality, 'owner': worker_id(), 'files': [], 'bytes': 0}
+        # One prefetch per video, however many workers were asked about it
+        if not self.backend.add('prefetch', key, entry, ttl=3 * PREFETCH_TTL):
+            return
+        # Checked after adding the entry: a download claims first and then adopts, so one
+        # of the two always sees the other
+        if self.claimed(key):
+            self.backend.delete('prefetch', key)
+            self.backend.incr('stats', 'prefetch', 'skipped_download')
+            return
+        if not self._reserve(key):
+            self.backend.delete('prefetch', key)
+            self.backend.incr('stats', 'prefetch', 'skipped_budget')
+            return
+
+        self.backend.incr('stats', 'prefetch', 'started')
+        thread = threading.Thread(target=self._run, args=(url, key, quality))
+        thread.daemon = True
+        thread.start()
+
+    def _run(self, url, key, quality):
+        sizes = {}  # filename -> bytes so far
+        seen = set()
+        files = set()  # the files this prefetch created, the only ones discard() may delete
+        existing = set()
+
+        def check(entry):
+            if entry is None or entry.get('control') == 'stop':
+                raise PrefetchStopped('Prefetch adopted by a download')
+            if sum(sizes.values()) >= PREFETCH_MAX_BYTES:
+                raise PrefetchStopped('Prefetch byte limit reached')
+
+        def progress_hook(d):
+            new_files = {d.get('tmpfilename'), d.get('filename')} - seen - {None}
+            if new_files:
+                seen.update(new_files)
+                files.update(name for name in new_files if os.path.basename(name) not in existing)
+                self.backend.update('prefetch', key, {'files': sorted(files)}, ttl=3 * PREFETCH_TTL)
+            if d.get('downloaded_bytes'):
+                sizes[d.get('filename')] = d['downloaded_bytes']
+            if transfer_complete(d):
+                # Let yt-dlp finish the file
+                return
+            check(self.backend.get('prefetch', key))
+
+        def postprocessor_hook(d):
+            # Merging etc. is left to the real download
+            if d.get('status') == 'started':
+                raise PrefetchStopped('Prefetch complete')
+
+        ydl_opts = {
+            'format': cost_format_selector(quality),
+            'outtmpl': self.outtmpl,
+            'merge_output_format': 'mp4',
+            'noplaylist': True,
+            'ratelimit': PREFETCH_RATE,
+            'progress_hooks': [progress_hook],
+            'postprocessor_hooks': [postprocessor_hook],
+            'quiet': True,
+            'no_warnings': True,
+            'noprogress': True
+        }
+        status = 'stopped'
+        try:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                try:
+                    info_dict = ydl.extract_info(url, download=False, process=False)
+                except Exception as e:
+                    if self.record is not None:
+                        self.record(url, key, e)
+                    raise
+                if self.record is not None:
+                    self.record(url, key, None)
+                # A download may already have claimed the video while we were extracting
+                check(self.backend.get('prefetch', key))
+                folder = os.path.dirname(self.outtmpl)
+                existing.update(os.listdir(folder) if os.path.isdir(folder) else [])
+                ydl.process_ie_result(info_dict, download=True)
+        except PrefetchStopped:
+            pass
+        except Exception as e:
+            # Extraction failures were recorded above, download failures are left to the real download
+            print(f"Prefetch of {url} failed: {str(e)}")
+            status = 'failed'
+        finally:
+            self.backend.update('prefetch', key, {
+                'status': status,
+                'files': sorted(files),
+                'bytes': sum(sizes.values())
+            }, ttl=3 * PREFETCH_TTL)
+            timer = threading.Timer(PREFETCH_TTL, self.discard, args=(key,))
+            timer.daemon = True
+            timer.start()
+
+    def _settle(self, key, new_status):
+        """Move a stopped prefetch to new_status, return its entry if this call did it"""
+        settled = {}
+
+        def change(entry):
+            if entry.get('status') in ('stopped', 'failed'):
+                settled['entry'] = dict(entry)
+                entry['status'] = new_status
+
+        self.backend.modify('prefetch', key, change, ttl=3 * PREFETCH_TTL)
+        if 'entry' in settled:
+            self._release(key)
+        return settled.get('entry')
+
+    def discard(self, key):
+        """Delete the files a prefetch nobody adopted has created"""
+        entry = self._settle(key, 'discarded')
+        if entry is None:
+            return
+        remove_partial_files(entry['files'])
+        self.backend.incr('stats', 'prefetch', 'discarded')
+        self.backend.incr('stats', 'prefetch', 'discarded_bytes', entry['bytes'])
+
+    def adopt(self, key, quality):
+        """Stop any prefetch of this video before a real download writes the same files
+
+        Returns the adopted prefetch entry ('bytes' the download will reuse, 'files'
+        it now owns), or None. A prefetch of a different quality is discarded instead.
+        """
+        if not PREFETCH_ENABLED or self.backend.get('prefetch', key) is None:
+            return None
+
+        def stop(entry):
+            if entry.get('status') == 'running':
+                entry['control'] = 'stop'
+
+        self.backend.modify('prefetch', key, stop, ttl=3 * PREFETCH_TTL)
+        # The prefetch stops on its next progress update
+        deadline = time.time() + PREFETCH_ADOPT_TIMEOUT
+        while time.time() < deadline:
+            entry = self.backend.get('prefetch', key)
+            if entry is None or entry.get('status') != 'running':
+                break
+            time.sleep(0.05)
+        else:
+            print(f"Prefetch of {key} did not stop within {PREFETCH_ADOPT_TIMEOUT}s, downloading anyway")
+
+        entry = self.backend.get('prefetch', key)
+        if entry is not None and entry.get('quality') != quality:
+            self.discard(key)
+            return None
+        entry = self._settle(key, 'adopted')
+        if entry is None:
+            return None
+        self.backend.incr('stats', 'prefetch', 'adopted')
+        self.backend.incr('stats', 'prefetch', 'adopted_bytes', entry['bytes'])
+        return entry
@@ -0,0 +1,409 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# Redis is optional - only needed when STATE_BACKEND=redis
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# How often expired entries are swept out (seconds). Reads skip expired entries anyway, but keys
+# written once and never read again (per-client buckets, negative cache, ...) would pile up
+STATE_SWEEP_INTERVAL = int(os.environ.get('STATE_SWEEP_INTERVAL', 60))
+
+
+def worker_id():
+    """Identify the current worker process (used to record job ownership)"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class MemoryStateBackend:
+    """Per-process state, only suitable for a single worker"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.RLock()
+        self._last_sweep = time.time()
+
+    def _sweep(self):
+        now = time.time()
+        if now - self._last_sweep < STATE_SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        for name in [name for name, (_, expires) in self._data.items() if expires is not None and expires <= now]:
+            del self._data[name]
+
+    def _live(self, namespace, key):
+        entry = self._data.get((namespace, key))
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= time.time():
+            del self._data[(namespace, key)]
+            return None
+        return entry
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._live(namespace, key)
+            return json.loads(entry[0]) if entry else None
+
+    def set(self, namespace, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        with self._lock:
+            self._sweep()
+            self._data[(namespace, key)] = (json.dumps(value), expires)
+
+    def add(self, namespace, key, value, ttl=None):
+        """Set the key only if it does not exist yet, return True on success"""
+        with self._lock:
+            if self._live(namespace, key):
+                return False
+            self.set(namespace, key, value, ttl)
+            return True
+
+    def update(self, namespace, key, fields, ttl=None):
+        """Merge fields into a stored dict and return the merged value"""
+        with self._lock:
+            entry = self._live(namespace, key)
+            value = json.loads(entry[0]) if entry else {}
+            value.update(fields)
+            self.set(namespace, key, value, ttl)
+            return value
+
+    def incr(self, namespace, key, field, amount=1):
+        """Atomically add to a numeric field of a stored dict, return the new value"""
+        with self._lock:
+            entry = self._live(namespace, key)
+            value = json.loads(entry[0]) if entry else {}
+            value[field] = value.get(field, 0) + amount
+            self._data[(namespace, key)] = (json.dumps(value), entry[1] if entry else None)
+            return value[field]
+
+    def modify(self, namespace, key, change, ttl=None):
+        """Apply change() to a stored dict atomically and return the new value"""
+        with self._lock:
+            entry = self._live(namespace, key)
+            value = json.loads(entry[0]) if entry else {}
+            change(value)
+            self.set(namespace, key, value, ttl)
+            return value
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._data.pop((namespace, key), None)
+
+    def delete_if(self, namespace, key, check):
+        """Delete the key only if check(value) is true, return True if it was deleted"""
+        with self._lock:
+            entry = self._live(namespace, key)
+            if entry is None or not check(json.loads(entry[0])):
+                return False
+            del self._data[(namespace, key)]
+            return True
+
+    def keys(self, namespace):
+        with self._lock:
+            return [k for (ns, k) in list(self._data) if ns == namespace and self._live(ns, k)]
+
+
+class SQLiteStateBackend:
+    """State shared by all workers on one machine through a SQLite file in WAL mode"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._last_sweep = time.time()
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS state ('
+            ' namespace TEXT NOT NULL,'
+            ' key TEXT NOT NULL,'
+            ' value TEXT NOT NULL,'
+            ' expires REAL,'
+            ' PRIMARY KEY (namespace, key))'
+        )
+
+    def _conn(self):
+        # sqlite3 connections can't be shared between threads, keep one per thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _select(self, conn, namespace, key):
+        row = conn.execute(
+            'SELECT value, expires FROM state WHERE namespace = ? AND key = ?',
+            (namespace, key)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] <= time.time():
+            conn.execute('DELETE FROM state WHERE namespace = ? AND key = ?', (namespace, key))
+            return None
+        return json.loads(row[0])
+
+    def _write(self, conn, namespace, key, value, ttl):
+        now = time.time()
+        if now - self._last_sweep >= STATE_SWEEP_INTERVAL:
+            # Amortised over writes; each worker sweeps at most once per interval
+            self._last_sweep = now
+            conn.execute('DELETE FROM state WHERE expires IS NOT NULL AND expires <= ?', (now,))
+        expires = now + ttl if ttl else None
+        conn.execute(
+            'INSERT OR REPLACE INTO state (namespace, key, value, expires) VALUES (?, ?, ?, ?)',
+            (namespace, key, json.dumps(value), expires)
+        )
+
+    def get(self, namespace, key):
+        return self._select(self._conn(), namespace, key)
+
+    def set(self, namespace, key, value, ttl=None):
+        self._write(self._conn(), namespace, key, value, ttl)
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        # BEGIN IMMEDIATE takes the write lock up front so concurrent merges don't lose fields
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def add(self, namespace, key, value, ttl=None):
+        """Set the key only if it does not exist yet, return True on success"""
+        with self._transaction() as conn:
+            if self._select(conn, namespace, key) is not None:
+                return False
+            self._write(conn, namespace, key, value, ttl)
+            return True
+
+    def update(self, namespace, key, fields, ttl=None):
+        """Merge fields into a stored dict and return the merged value"""
+        with self._transaction() as conn:
+            value = self._select(conn, namespace, key) or {}
+            value.update(fields)
+            self._write(conn, namespace, key, value, ttl)
+            return value
+
+    def incr(self, namespace, key, field, amount=1):
+        """Atomically add to a numeric field of a stored dict, return the new value"""
+        with self._transaction() as conn:
+            value = self._select(conn, namespace, key) or {}
+            value[field] = value.get(field, 0) + amount
+            # Keep the entry's expiry, if it has one (an expired entry was dropped by _select)
+            conn.execute(
+                'INSERT INTO state (namespace, key, value, expires) VALUES (?, ?, ?, NULL)'
+                ' ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value',
+                (namespace, key, json.dumps(value))
+            )
+            return value[field]
+
+    def modify(self, namespace, key, change, ttl=None):
+        """Apply change() to a stored dict atomically and return the new value"""
+        with self._transaction() as conn:
+            value = self._select(conn, namespace, key) or {}
+            change(value)
+            self._write(conn, namespace, key, value, ttl)
+            return value
+
+    def delete(self, namespace, key):
+        self._conn().execute('DELETE FROM state WHERE namespace = ? AND key = ?', (namespace, key))
+
+    def delete_if(self, namespace, key, check):
+        """Delete the key only if check(value) is true, return True if it was deleted"""
+        with self._transaction() as conn:
+            value = self._select(conn, namespace, key)
+            if value is None or not check(value):
+                return False
+            conn.execute('DELETE FROM state WHERE namespace = ? AND key = ?', (namespace, key))
+            return True
+
+    def keys(self, namespace):
+        rows = self._conn().execute(
+            'SELECT key FROM state WHERE namespace = ? AND (expires IS NULL OR expires > ?)',
+            (namespace, time.time())
+        ).fetchall()
+        return [row[0] for row in rows]
+
+
+def _seconds(ttl):
+    # Redis expiries are whole seconds and must be positive
+    return max(1, int(ttl)) if ttl else None
+
+
+class RedisStateBackend:
+    """State shared across machines through Redis (or anything speaking its protocol)"""
+
+    def __init__(self, client, prefix='h4ck3rtube'):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, namespace, key):
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def get(self, namespace, key):
+        raw = self.client.get(self._key(namespace, key))
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, namespace, key, value, ttl=None):
+        self.client.set(self._key(namespace, key), json.dumps(value), ex=_seconds(ttl))
+
+    def add(self, namespace, key, value, ttl=None):
+        """Set the key only if it does not exist yet, return True on success"""
+        return bool(self.client.set(
+            self._key(namespace, key), json.dumps(value), ex=_seconds(ttl), nx=True
+        ))
+
+    def modify(self, namespace, key, change, ttl=None):
+        """Apply change() to a stored dict atomically and return the new value"""
+        return self._modify(namespace, key, change, ex=_seconds(ttl))
+
+    def _modify(self, namespace, key, change, **set_args):
+        name = self._key(namespace, key)
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    # Optimistic locking: retry if another worker wrote the key meanwhile
+                    pipe.watch(name)
+                    raw = pipe.get(name)
+                    value = json.loads(raw) if raw is not None else {}
+                    change(value)
+                    pipe.multi()
+                    pipe.set(name, json.dumps(value), **set_args)
+                    pipe.execute()
+                    return value
+                except redis.WatchError:
+                    continue
+
+    def update(self, namespace, key, fields, ttl=None):
+        """Merge fields into a stored dict and return the merged value"""
+        return self.modify(namespace, key, lambda value: value.update(fields), ttl)
+
+    def incr(self, namespace, key, field, amount=1):
+        """Atomically add to a numeric field of a stored dict, return the new value"""
+        def change(value):
+            value[field] = value.get(field, 0) + amount
+        # KEEPTTL (Redis 6+) leaves an existing expiry in place, like the other backends
+        return self._modify(namespace, key, change, keepttl=True)[field]
+
+    def delete(self, namespace, key):
+        self.client.delete(self._key(namespace, key))
+
+    def delete_if(self, namespace, key, check):
+        """Delete the key only if check(value) is true, return True if it was deleted"""
+        name = self._key(namespace, key)
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(name)
+                    raw = pipe.get(name)
+                    if raw is None or not check(json.loads(raw)):
+                        pipe.unwatch()
+                        return False
+                    pipe.multi()
+                    pipe.delete(name)
+                    pipe.execute()
+                    return True
+                except redis.WatchError:
+                    continue
+
+    def keys(self, namespace):
+        pattern = self._key(namespace, '*')
+        offset = len(self._key(namespace, ''))
+        keys = []
+        for name in self.client.scan_iter(match=pattern):
+            if isinstance(name, bytes):
+                name = name.decode('utf-8')
+            keys.append(name[offset:])
+        return keys
+
+
+class SharedDict:
+    """Dict-like view over one namespace of a state backend
+
+    Values are copies: mutate stored dicts with merge() rather than
+    updating the object returned by [] so other workers see the change.
+    """
+
+    def __init__(self, backend, namespace, ttl=None):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+
+    def __contains__(self, key):
+        return self.backend.get(self.namespace, key) is not None
+
+    def __getitem__(self, key):
+        value = self.backend.get(self.namespace, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.backend.set(self.namespace, key, value, self.ttl)
+
+    def __delitem__(self, key):
+        self.backend.delete(self.namespace, key)
+
+    def get(self, key, default=None):
+        value = self.backend.get(self.namespace, key)
+        return default if value is None else value
+
+    def add(self, key, value):
+        return self.backend.add(self.namespace, key, value, self.ttl)
+
+    def merge(self, key, fields):
+        return self.backend.update(self.namespace, key, fields, self.ttl)
+
+    def incr(self, key, field, amount=1):
+        return self.backend.incr(self.namespace, key, field, amount)
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        self.backend.delete(self.namespace, key)
+        return value
+
+    def keys(self):
+        return self.backend.keys(self.namespace)
+
+
+def create_state_backend(kind=None):
+    """Create the state backend selected by the STATE_BACKEND environment variable
+
+    - memory: per-process dicts (single worker only)
+    - sqlite: a WAL-mode SQLite file shared by every worker on the machine (default)
+    - redis:  a Redis-compatible server at REDIS_URL, shared across machines
+    """
+    kind = (kind or os.environ.get('STATE_BACKEND', 'sqlite')).lower()
+
+    if kind == 'memory':
+        return MemoryStateBackend()
+
+    if kind == 'redis':
+        if not REDIS_AVAILABLE:
+            raise RuntimeError('STATE_BACKEND=redis requires the redis package (pip install redis)')
+        client = redis.Redis.from_url(os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+        return RedisStateBackend(client, prefix=os.environ.get('REDIS_PREFIX', 'h4ck3rtube'))
+
+    if kind == 'sqlite':
+        path = os.environ.get(
+            'STATE_DB_PATH',
+            os.path.join(tempfile.gettempdir(), 'h4ck3r_tube_state.sqlite3')
+        )
+        return SQLiteStateBackend(path)
+
+    raise ValueError(f"Unknown STATE_BACKEND: {kind}")
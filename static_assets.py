@@ -0,0 +1,180 @@
+"""Content-hashed, precompressed static assets
+
+Build step (run before deploying, also called from build.sh):
+
+    python static_assets.py [static_dir]
+
+Every file under static/ is minified (JS/CSS), copied to static/dist/ under a
+name containing its content hash, and precompressed to .gz (and .br when the
+brotli package is installed). static/dist/manifest.json maps the original
+paths to the hashed ones.
+
+At runtime init_app() makes url_for('static', filename='js/main.js') point to
+the hashed file, and serves hashed files with an immutable Cache-Control so
+browsers never ask for them again.
+"""
+import os
+import re
+import sys
+import gzip
+import json
+import shutil
+import hashlib
+import mimetypes
+
+from flask import request, send_from_directory
+
+# Optional, better minifiers/compressors - the build falls back to simple built-ins
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# Hashed names change with their content, so they can be cached forever
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Only text formats are worth compressing, and only past a few hundred bytes
+COMPRESSIBLE_EXTENSIONS = ('.js', '.css', '.html', '.svg', '.json', '.txt', '.ico')
+MIN_COMPRESS_SIZE = 256
+
+
+def minify_js(source):
+    """Minify JavaScript, conservatively unless rjsmin is installed"""
+    if rjsmin is not None:
+        return rjsmin.jsmin(source)
+    # Only drop whole-line comments, indentation and blank lines. Line breaks are
+    # kept so automatic semicolon insertion still works
+    lines = []
+    for line in source.splitlines():
+        stripped = line.strip()
+        if stripped and not stripped.startswith('//'):
+            lines.append(stripped)
+    return '\n'.join(lines) + '\n'
+
+
+def minify_css(source):
+    """Minify CSS, with rcssmin if installed"""
+    if rcssmin is not None:
+        return rcssmin.cssmin(source)
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{}:;,>])\s*', r'\1', source)
+    return source.replace(';}', '}').strip() + '\n'
+
+
+MINIFIERS = {
+    '.js': minify_js,
+    '.css': minify_css,
+}
+
+
+def hashed_name(path, data):
+    """js/main.js -> js/main.<first 10 hex chars of sha256>.js"""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+
+
+def write_compressed(path, data):
+    """Write .gz (and .br) next to path"""
+    # mtime=0 keeps the output byte-for-byte reproducible between builds
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+
+
+def build(static_dir):
+    """Minify, fingerprint and precompress everything in static_dir into static_dir/dist"""
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    if os.path.exists(dist_dir):
+        shutil.rmtree(dist_dir)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        # Don't descend into a previous build
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_dir]
+        for name in sorted(files):
+            source_path = os.path.join(root, name)
+            rel_path = os.path.relpath(source_path, static_dir).replace(os.sep, '/')
+            ext = os.path.splitext(name)[1].lower()
+
+            with open(source_path, 'rb') as f:
+                data = f.read()
+            if ext in MINIFIERS:
+                data = MINIFIERS[ext](data.decode('utf-8')).encode('utf-8')
+
+            target_rel = hashed_name(rel_path, data)
+            target_path = os.path.join(dist_dir, *target_rel.split('/'))
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            with open(target_path, 'wb') as f:
+                f.write(data)
+            if ext in COMPRESSIBLE_EXTENSIONS and len(data) >= MIN_COMPRESS_SIZE:
+                write_compressed(target_path, data)
+
+            manifest[rel_path] = f"{DIST_DIR}/{target_rel}"
+
+    os.makedirs(dist_dir, exist_ok=True)
+    with open(os.path.join(dist_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_dir):
+    path = os.path.join(static_dir, DIST_DIR, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def init_app(app):
+    """Serve built assets from the Flask app (no-op until the build step has run)"""
+    manifest = load_manifest(app.static_folder)
+    if not manifest:
+        return
+    dist_dir = os.path.join(app.static_folder, DIST_DIR)
+
+    @app.url_defaults
+    def hashed_static_url(endpoint, values):
+        # Rewrites url_for('static', ...) in every template to the hashed file
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    def serve_hashed(filename):
+        accepted = request.headers.get('Accept-Encoding', '')
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if encoding in accepted and os.path.isfile(os.path.join(dist_dir, filename + suffix)):
+                response = send_from_directory(dist_dir, filename + suffix, mimetype=mimetype)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(dist_dir, filename)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    # More specific than Flask's own /static/<path:filename>, so it takes precedence
+    app.add_url_rule(f"{app.static_url_path}/{DIST_DIR}/<path:filename>", 'static_dist', serve_hashed)
+
+
+if __name__ == '__main__':
+    static_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'static'
+    )
+    for source, target in sorted(build(static_dir).items()):
+        print(f"{source} -> {target}")
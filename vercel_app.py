@@ -5,6 +5,8 @@ import uuid
 import time
 import re
 import json
+import static_assets
+from video_metadata import extract_projected
 from urllib.parse import urlparse, parse_qs
 import requests  # Added for HTTP requests
 
@@ -27,6 +29,9 @@ app = Flask(__name__,
             static_folder=static_dir)
 CORS(app)  # Enable CORS for all routes
 
+# Serve fingerprinted, precompressed assets once `python static_assets.py` has been run
+static_assets.init_app(app)
+
 # For Vercel deployment
 IS_VERCEL = os.environ.get('VERCEL_ENV', True)  # Default to True for Vercel
 DOWNLOADS_ENABLED = False  # Always disabled for Vercel
@@ -58,40 +63,18 @@ def get_video_info(url, request_id):
         }
         
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # Extract basic info first - more lightweight
-            info_dict = ydl.extract_info(url, download=False, process=False)
+            # Extract the raw info and project it down to the API fields right away,
+            # so the full dict (manifests, captions, headers) is freed immediately
+            result = extract_projected(ydl, url, 'lean')
             
-            if info_dict is None:
+            if result is None:
                 video_info_cache[request_id] = {
                     'status': 'error',
                     'error': 'Failed to retrieve video information'
                 }
                 return
             
-            # Get basic video info only
-            title = info_dict.get('title', 'Unknown')
-            duration = info_dict.get('duration')
-            
-            # Use a simplified format list to reduce memory usage
-            formats = []
-            # Only process a few key formats to save memory
-            for fmt in info_dict.get('formats', [])[:5]:  # Limit to first 5 formats
-                if fmt.get('format_id'):
-                    formats.append({
-                        'format_id': fmt.get('format_id'),
-                        'format': fmt.get('format', 'Unknown'),
-                        'ext': fmt.get('ext', 'mp4')
-                    })
-            
-            # Prepare response with minimal data
-            video_info_cache[request_id] = {
-                'status': 'success',
-                'title': title,
-                'duration': duration,
-                'formats': formats,
-                'url': url,
-                'timestamp': time.time()
-            }
+            video_info_cache[request_id] = result
             
     except MemoryError:
         video_info_cache[request_id] = {
@@ -200,7 +183,8 @@ def get_info():
         
         # Return the result
         if request_id in video_info_cache:
-            result = video_info_cache[request_id]
+            # The entry is only needed for this response, don't keep it around
+            result = video_info_cache.pop(request_id)
             return jsonify({
                 'success': result['status'] == 'success',
                 'info': result,
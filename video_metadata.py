@@ -0,0 +1,87 @@
+import time
+
+from format_selection import QUALITY_TARGETS, choose_format, describe_choice
+
+# Extraction modes (EXTRACTION_MODE):
+# - full: let yt-dlp fully process the result (sorted, sanitized formats with per-format
+#         http_headers etc.), then build the API response from it
+# - lean: take the raw extractor result (process=False) and project it down to the
+#         API fields immediately, so manifests, captions and headers are dropped early
+EXTRACTION_MODES = ('full', 'lean')
+
+# Per-format fields needed for the API and for format selection; everything else is dropped
+FORMAT_FIELDS = (
+    'format_id', 'format', 'format_note', 'ext', 'protocol', 'width', 'height', 'fps',
+    'vcodec', 'acodec', 'abr', 'tbr', 'filesize', 'filesize_approx'
+)
+
+
+def project_format(fmt):
+    """Copy only the fields we use out of a yt-dlp format dict"""
+    projected = {field: fmt.get(field) for field in FORMAT_FIELDS if fmt.get(field) is not None}
+    if 'format' not in projected:
+        # Raw (unprocessed) formats have no display name yet
+        resolution = f"{fmt['width']}x{fmt['height']}" if fmt.get('width') and fmt.get('height') else (
+            'audio only' if fmt.get('vcodec') == 'none' else 'unknown')
+        note = f" ({fmt['format_note']})" if fmt.get('format_note') else ''
+        projected['format'] = f"{fmt.get('format_id')} - {resolution}{note}"
+    return projected
+
+
+def project_info(info_dict, url):
+    """Build the /api/video-info result from a yt-dlp info dict"""
+    # Get thumbnail URLs
+    thumbnails = []
+    if 'thumbnail' in info_dict:
+        thumbnails.append({'url': info_dict['thumbnail'], 'type': 'default'})
+
+    if 'thumbnails' in info_dict:
+        for i, thumb in enumerate(info_dict['thumbnails']):
+            if 'url' in thumb:
+                thumbnails.append({'url': thumb['url'], 'type': f'thumbnail_{i}'})
+
+    formats = [project_format(fmt) for fmt in info_dict.get('formats') or [] if fmt.get('format_id')]
+    duration = info_dict.get('duration')
+
+    # What each quality option would actually download, and roughly how big it is
+    quality_options = {
+        quality: describe_choice(choose_format(formats, quality, duration))
+        for quality in QUALITY_TARGETS
+    }
+
+    return {
+        'status': 'success',
+        'title': info_dict.get('title', 'Unknown'),
+        'duration': duration,
+        'thumbnails': thumbnails,
+        'formats': [
+            {
+                'format_id': fmt['format_id'],
+                'format': fmt.get('format'),
+                'width': fmt.get('width'),
+                'height': fmt.get('height'),
+                'ext': fmt.get('ext')
+            }
+            for fmt in formats
+        ],
+        'quality_options': quality_options,
+        'url': url,
+        'timestamp': time.time()
+    }
+
+
+def extract_projected(ydl, url, mode='lean'):
+    """Extract and project video info with an open YoutubeDL, return None if extraction failed"""
+    if mode == 'lean':
+        info_dict = ydl.extract_info(url, download=False, process=False)
+        if info_dict is not None and info_dict.get('_type') in ('url', 'url_transparent'):
+            # A redirect to another page has no formats of its own, resolve it
+            info_dict = ydl.process_ie_result(info_dict, download=False)
+    else:
+        info_dict = ydl.extract_info(url, download=False)
+
+    if info_dict is None:
+        return None
+    # Only the projection leaves this function; the raw dict (manifests, captions,
+    # headers) becomes garbage right here instead of living until the response is sent
+    return project_info(info_dict, url)